@@ -2,6 +2,10 @@ import numpy as np
 import itertools
 import matplotlib.pyplot as plt
 
+EARTH_RADIUS_KM = 6371.0
+# Default number of distances calculated at once by get_tsp_matrix.
+DISTANCE_CHUNK_ELEMENTS = 2**18
+
 def create_nodes_array(N, seed=None):
     """
     Creates array of random points of size N.
@@ -16,68 +20,192 @@ def create_nodes_array(N, seed=None):
     return np.array(nodes_list)
 
 
-def get_tsp_matrix(nodes_array):
+def get_tsp_matrix(nodes_array, metric="euclidean", dtype=np.float64, chunk_size=None):
     """
     Creates distance matrix out of given coordinates.
+    Available metrics are "euclidean", "sqeuclidean", "manhattan" and "haversine".
+    For "haversine" coordinates are (latitude, longitude) in degrees
+    and distances are in kilometers.
+    dtype=np.float32 halves the memory used by the final matrix; distances
+    are still calculated in float64 and cast block by block.
+    The matrix is filled in blocks of chunk_size rows, which bounds the size
+    of intermediate arrays for thousands of nodes. By default blocks hold
+    about DISTANCE_CHUNK_ELEMENTS distances, so the peak memory is
+    dominated by the matrix itself.
     """
+    nodes_array = np.asarray(nodes_array, dtype=np.float64)
     number_of_nodes = len(nodes_array)
-    matrix = np.zeros((number_of_nodes, number_of_nodes))
-    for i in range(number_of_nodes):
-        for j in range(i, number_of_nodes):
-            matrix[i][j] = distance_between_points(nodes_array[i], nodes_array[j])
-            matrix[j][i] = matrix[i][j]
+    if chunk_size is None:
+        chunk_size = DISTANCE_CHUNK_ELEMENTS // max(number_of_nodes, 1)
+    chunk_size = max(chunk_size, 1)
+    matrix = np.empty((number_of_nodes, number_of_nodes), dtype=dtype)
+    for start in range(0, number_of_nodes, chunk_size):
+        end = start + chunk_size
+        matrix[start:end] = calculate_distances(nodes_array[start:end], nodes_array, metric)
     return matrix
 
 
+def calculate_distances(points_A, points_B, metric="euclidean"):
+    """
+    Calculates distances between every point from points_A and every point
+    from points_B using broadcasting. Returns a (len(points_A), len(points_B)) array.
+    """
+    points_A = np.asarray(points_A, dtype=np.float64)[:, np.newaxis, :]
+    points_B = np.asarray(points_B, dtype=np.float64)[np.newaxis, :, :]
+    if metric == "euclidean":
+        return np.sqrt(((points_A - points_B)**2).sum(axis=2))
+    elif metric == "sqeuclidean":
+        return ((points_A - points_B)**2).sum(axis=2)
+    elif metric == "manhattan":
+        return np.abs(points_A - points_B).sum(axis=2)
+    elif metric == "haversine":
+        latitude_A, longitude_A = np.radians(points_A[..., 0]), np.radians(points_A[..., 1])
+        latitude_B, longitude_B = np.radians(points_B[..., 0]), np.radians(points_B[..., 1])
+        a = np.sin((latitude_B - latitude_A) / 2)**2 \
+            + np.cos(latitude_A) * np.cos(latitude_B) * np.sin((longitude_B - longitude_A) / 2)**2
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+    else:
+        raise ValueError("Unknown metric: " + str(metric))
+
+
 def distance_between_points(point_A, point_B):
     return np.sqrt((point_A[0] - point_B[0])**2 + (point_A[1] - point_B[1])**2)
 
 
-def solve_tsp_brute_force(nodes_array):
+def solve_tsp_brute_force(nodes_array, cost_matrix=None):
     number_of_nodes = len(nodes_array)
     initial_order = range(0, number_of_nodes)
-    all_permutations = [list(x) for x in itertools.permutations(initial_order)]
-    cost_matrix = get_tsp_matrix(nodes_array)
-    best_permutation = all_permutations[0]
-    best_cost = calculate_cost(cost_matrix, all_permutations[0])
-    for permutation in all_permutations:
-        current_cost = calculate_cost(cost_matrix, permutation)
-        if current_cost < best_cost:
-            best_permutation = permutation
-            best_cost = current_cost
+    all_permutations = itertools.permutations(initial_order)
+    if cost_matrix is None:
+        cost_matrix = get_tsp_matrix(nodes_array)
+    best_permutation, best_cost = find_cheapest_permutation(cost_matrix, all_permutations)
     print("Brute force:", best_permutation, best_cost)
     return best_permutation
 
 
-def solve_tsp_brute_force_from_given_node(nodes_array, starting_node):
+def solve_tsp_brute_force_from_given_node(nodes_array, starting_node, cost_matrix=None):
     number_of_nodes = len(nodes_array)
-    initial_order = range(0, number_of_nodes)
-    all_permutations = [list(x) for x in itertools.permutations(initial_order)]
-    cost_matrix = get_tsp_matrix(nodes_array)
-    best_permutation = all_permutations[0]
-    best_cost = calculate_cost(cost_matrix, all_permutations[0])*1000
-    for permutation in all_permutations:
-        if permutation[0] != starting_node:
-            continue
-        current_cost = calculate_cost(cost_matrix, permutation)
-        if current_cost < best_cost:
-            best_permutation = permutation
-            best_cost = current_cost
+    other_nodes = [node for node in range(0, number_of_nodes) if node != starting_node]
+    all_permutations = ((starting_node,) + x for x in itertools.permutations(other_nodes))
+    if cost_matrix is None:
+        cost_matrix = get_tsp_matrix(nodes_array)
+    best_permutation, best_cost = find_cheapest_permutation(cost_matrix, all_permutations)
     print("Brute force:", best_permutation, best_cost)
     return best_permutation
 
 
+def find_cheapest_permutation(cost_matrix, permutations, chunk_size=100000):
+    """
+    Returns the cheapest of given permutations together with its cost.
+    Permutations are scored in chunks, so they are never all held in memory.
+    """
+    best_permutation = None
+    best_cost = np.inf
+    for chunk, costs in calculate_costs_in_chunks(cost_matrix, permutations, chunk_size):
+        best_index = np.argmin(costs)
+        if costs[best_index] < best_cost:
+            best_permutation = chunk[best_index].tolist()
+            best_cost = costs[best_index]
+    return best_permutation, best_cost
+
+
+def solve_tsp_dynamic_programming(nodes_array, starting_node=0, cost_matrix=None, verbose=True):
+    """
+    Solves TSP exactly with the Held-Karp algorithm in O(n^2 * 2^n) time.
+    Partial tour costs are stored in a NumPy table indexed by
+    (bitmask of visited nodes, last visited node), so memory is bounded by
+    2^(n-1) * (n-1) entries instead of n! permutations.
+    Returns the optimal order of nodes, beginning with starting_node.
+    A precomputed cost_matrix can be passed to avoid rebuilding it.
+    The solution is printed unless verbose is False.
+    """
+    if cost_matrix is None:
+        cost_matrix = get_tsp_matrix(nodes_array)
+    cost_matrix = np.asarray(cost_matrix)
+    number_of_nodes = len(cost_matrix)
+    other_nodes = np.array([node for node in range(number_of_nodes) if node != starting_node])
+    if number_of_nodes < 3:
+        best_permutation = [starting_node] + other_nodes.tolist()
+        if verbose:
+            print("Held-Karp:", best_permutation, calculate_cost(cost_matrix, best_permutation))
+        return best_permutation
+
+    reduced_number_of_nodes = number_of_nodes - 1
+    distances = cost_matrix[np.ix_(other_nodes, other_nodes)]
+    costs_from_start = cost_matrix[starting_node, other_nodes]
+    costs_to_start = cost_matrix[other_nodes, starting_node]
+
+    # costs[subset, last] is the cheapest path leaving starting_node, visiting
+    # every node in subset and ending in last. Entries with last outside of
+    # subset are never written, so they stay infinite.
+    number_of_subsets = 1 << reduced_number_of_nodes
+    costs = np.full((number_of_subsets, reduced_number_of_nodes), np.inf)
+    parents = np.full((number_of_subsets, reduced_number_of_nodes), -1, dtype=np.int8)
+    nodes = np.arange(reduced_number_of_nodes)
+    costs[1 << nodes, nodes] = costs_from_start
+
+    subsets = np.arange(number_of_subsets)
+    subset_sizes = np.zeros(number_of_subsets, dtype=np.int8)
+    for node in nodes:
+        subset_sizes += (subsets >> node) & 1
+
+    for size in range(2, reduced_number_of_nodes + 1):
+        subsets_of_size = subsets[subset_sizes == size]
+        for last in nodes:
+            current_subsets = subsets_of_size[(subsets_of_size >> last) & 1 == 1]
+            previous_subsets = current_subsets ^ (1 << last)
+            candidates = costs[previous_subsets] + distances[:, last]
+            best_previous = np.argmin(candidates, axis=1)
+            costs[current_subsets, last] = candidates[np.arange(len(current_subsets)), best_previous]
+            parents[current_subsets, last] = best_previous
+
+    subset = number_of_subsets - 1
+    last = int(np.argmin(costs[subset] + costs_to_start))
+    best_cost = costs[subset, last] + costs_to_start[last]
+    reversed_order = []
+    while last != -1:
+        reversed_order.append(other_nodes[last])
+        previous = int(parents[subset, last])
+        subset ^= 1 << last
+        last = previous
+    best_permutation = [starting_node] + [int(node) for node in reversed(reversed_order)]
+    if verbose:
+        print("Held-Karp:", best_permutation, best_cost)
+    return best_permutation
+
+
 def calculate_cost(cost_matrix, solution):
-    cost = 0
-    for i in range(len(solution)):
-        a = i%len(solution)
-        b = (i+1)%len(solution)
-        cost += cost_matrix[solution[a]][solution[b]]
+    return calculate_costs(cost_matrix, [solution])[0]
 
-    return cost
 
+def calculate_costs(cost_matrix, tours):
+    """
+    Calculates costs of many closed tours at once.
+    tours is an (m, n) integer array, in which every row is an order of nodes.
+    Returns an array with m costs.
+    """
+    if len(tours) == 0:
+        return np.zeros(0)
+    tours = np.asarray(tours, dtype=int).reshape(len(tours), -1)
+    next_nodes = np.roll(tours, -1, axis=1)
+    return np.asarray(cost_matrix)[tours, next_nodes].sum(axis=1)
 
-def plot_solution(name, nodes_array, solution):
+
+def calculate_costs_in_chunks(cost_matrix, tours, chunk_size=100000):
+    """
+    Streaming version of calculate_costs.
+    Takes any iterable of tours (e.g. itertools.permutations) and yields
+    pairs (chunk, costs), where chunk is an array of at most chunk_size tours.
+    """
+    tours = iter(tours)
+    while True:
+        chunk = np.array(list(itertools.islice(tours, chunk_size)), dtype=int)
+        if len(chunk) == 0:
+            return
+        yield chunk, calculate_costs(cost_matrix, chunk)
+
+
+def plot_solution(name, nodes_array, solution, cost_matrix=None):
     plt.scatter(nodes_array[:, 0], nodes_array[:, 1], s=200)
     for i in range(len(nodes_array)):
         plt.annotate(i, (nodes_array[i, 0] + 0.15, nodes_array[i, 1] + 0.15), size=16, color='r')
@@ -91,7 +219,9 @@ def plot_solution(name, nodes_array, solution):
         B = solution[b]
         plt.plot([nodes_array[A, 0], nodes_array[B, 0]], [nodes_array[A, 1], nodes_array[B, 1]], c='r')
 
-    cost = calculate_cost(get_tsp_matrix(nodes_array), solution)
+    if cost_matrix is None:
+        cost_matrix = get_tsp_matrix(nodes_array)
+    cost = calculate_cost(cost_matrix, solution)
     title_string = "Cost:" + str(cost)
     title_string += "\n" + str(solution)
     plt.title(title_string)
@@ -122,3 +252,20 @@ def binary_state_to_points_order(binary_state):
             if binary_state[(number_of_points) * p + j] == 1:
                 points_order.append(j)
     return points_order
+
+
+def binary_states_to_points_orders(binary_states):
+    """
+    Vectorized version of binary_state_to_points_order for a (m, n^2) array of states.
+    Every state is reshaped to an (n, n) matrix with times in rows and points
+    in columns. Returns an (m, n) array with orders of points and a boolean mask,
+    which marks states encoding valid permutations (exactly one 1 in every
+    row and every column). Orders of invalid states are meaningless.
+    """
+    binary_states = np.asarray(binary_states)
+    number_of_points = int(np.sqrt(binary_states.shape[1]))
+    matrices = binary_states.reshape(len(binary_states), number_of_points, number_of_points)
+    feasible = (matrices.sum(axis=2) == 1).all(axis=1) & (matrices.sum(axis=1) == 1).all(axis=1)
+    points_orders = np.argmax(matrices, axis=2)
+    return points_orders, feasible
+
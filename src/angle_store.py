@@ -0,0 +1,85 @@
+import os
+import numpy as np
+
+from json_store import load_json, save_json
+
+
+class AngleStore(object):
+    """
+    Store of optimal QAOA angles, reused as starting points for similar instances,
+    since optimal angles concentrate for instances of the same size and distribution
+    of distances. Angles are keyed by (reduced number of nodes, steps, type of the
+    initial state, statistics of distances normalized by their mean): the coefficient
+    of variation and the maximum, both rounded to bin_width.
+    The phase separator scales with the distances, so gammas are stored multiplied
+    by the mean distance and divided by it again for every instance.
+    Angles are kept in memory and, if directory is given, in JSON files there.
+    """
+    def __init__(self, directory=None, bin_width=0.25):
+        self.directory = directory
+        self.bin_width = bin_width
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def get_key(self, distance_matrix, steps, initial_state_type):
+        _, coefficient_of_variation, maximum = get_distance_statistics(distance_matrix)
+        bins = np.round(np.array([coefficient_of_variation, maximum]) / self.bin_width).astype(int)
+        return (len(distance_matrix) - 1, steps, initial_state_type) + tuple(bins.tolist())
+
+    def get_angles(self, distance_matrix, steps, initial_state_type="all"):
+        """
+        Returns (betas, gammas) stored for instances similar to the one with given
+        distances, with gammas rescaled to its distances, or None.
+        """
+        key = self.get_key(distance_matrix, steps, initial_state_type)
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = self.load(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries[key] = entry
+        mean_distance, _, _ = get_distance_statistics(distance_matrix)
+        return np.array(entry["betas"]), np.array(entry["gammas"]) / mean_distance
+
+    def put_angles(self, distance_matrix, steps, initial_state_type, betas, gammas):
+        """
+        Stores angles optimized for the instance with given distances,
+        replacing the ones stored for similar instances before.
+        """
+        key = self.get_key(distance_matrix, steps, initial_state_type)
+        mean_distance, _, _ = get_distance_statistics(distance_matrix)
+        previous_entry = self.entries.get(key) or self.load(key) or {"count": 0}
+        entry = {"betas": np.asarray(betas, dtype=float).tolist(),
+                 "gammas": (np.asarray(gammas, dtype=float) * mean_distance).tolist(),
+                 "count": previous_entry["count"] + 1}
+        self.entries[key] = entry
+        self.save(key, entry)
+
+    def get_path(self, key):
+        return os.path.join(self.directory, "angles_" + "_".join(str(part) for part in key) + ".json")
+
+    def load(self, key):
+        if self.directory is None:
+            return None
+        return load_json(self.get_path(key))
+
+    def save(self, key, entry):
+        if self.directory is not None:
+            save_json(self.get_path(key), entry)
+
+
+def get_distance_statistics(distance_matrix):
+    """
+    Returns the mean of distances between different nodes and the coefficient
+    of variation and the maximum of these distances divided by the mean.
+    """
+    distance_matrix = np.asarray(distance_matrix, dtype=float)
+    distances = distance_matrix[~np.eye(len(distance_matrix), dtype=bool)]
+    mean_distance = distances.mean()
+    normalized_distances = distances / mean_distance
+    return mean_distance, normalized_distances.std(), normalized_distances.max()
@@ -0,0 +1,233 @@
+import argparse
+import concurrent.futures
+import glob
+import os
+import time
+import numpy as np
+
+import TSP_utilities
+from dwave_tsp_solver import DWaveTSPSolver
+from heuristic_tsp_solver import HeuristicTSPSolver
+from samplers import SimulatedAnnealingSampler
+
+# Optimal costs are calculated with Held-Karp only up to this size.
+MAX_NODES_FOR_OPTIMAL_COST = 16
+
+
+def solve_exact(nodes_array, cost_matrix):
+    solution = TSP_utilities.solve_tsp_dynamic_programming(nodes_array, 0, cost_matrix=cost_matrix, verbose=False)
+    return solution, 1.0
+
+
+def solve_dwave(nodes_array, cost_matrix):
+    solver = DWaveTSPSolver(cost_matrix, sampler=SimulatedAnnealingSampler())
+    solution, _ = solver.solve_tsp()
+    return solution, solver.get_feasibility_rate()
+
+
+def solve_heuristic(nodes_array, cost_matrix):
+    solution, _ = HeuristicTSPSolver(cost_matrix).solve_tsp()
+    return solution, 1.0
+
+
+def solve_decomposition_forest(nodes_array, cost_matrix):
+    from decomposition_tsp_solver import DecompositionTSPSolver
+    solution, _ = DecompositionTSPSolver(cost_matrix, subproblem_size=5, subsolver="forest").solve_tsp()
+    return solution, 1.0
+
+
+def solve_forest(nodes_array, cost_matrix):
+    from forest_tsp_solver import ForestTSPSolver
+    solver = ForestTSPSolver(cost_matrix, backend="subspace", use_gradient=True)
+    solution, distribution = solver.solve_tsp()
+    return solution, distribution.get_feasibility_rate()
+
+
+# Every solver takes (nodes_array, cost_matrix) and returns (solution, feasibility_rate).
+SOLVERS = {"exact": solve_exact,
+           "heuristic": solve_heuristic,
+           "dwave": solve_dwave,
+           "forest": solve_forest,
+           "decomposition_forest": solve_decomposition_forest}
+
+
+def generate_instances(number_of_nodes, seeds):
+    """
+    Yields (instance_id, nodes_array) pairs of random instances created with given seeds.
+    """
+    for seed in seeds:
+        yield "random_" + str(number_of_nodes) + "_" + str(seed), TSP_utilities.create_nodes_array(number_of_nodes, seed=seed)
+
+
+def load_instances(directory):
+    """
+    Yields (instance_id, nodes_array) pairs for all the .npy files with coordinates
+    in given directory; instance_id is the name of the file without extension.
+    """
+    for path in sorted(glob.glob(os.path.join(directory, "*.npy"))):
+        yield os.path.splitext(os.path.basename(path))[0], np.load(path)
+
+
+def run_instance(solver_name, instance_id, nodes_array):
+    """
+    Solves one instance with given solver and returns a record with the tour,
+    its cost, the optimality gap, the feasibility rate, the wall time and the error.
+    If solving fails, the record has an empty tour, NaN results and the error
+    message, so one failing instance does not stop the whole batch.
+    """
+    start_time = time.time()
+    try:
+        return solve_instance(solver_name, instance_id, nodes_array)
+    except Exception as error:
+        return {"instance_id": instance_id,
+                "solver": solver_name,
+                "tour": np.zeros(0, dtype=np.int32),
+                "cost": np.nan,
+                "optimal_cost": np.nan,
+                "optimality_gap": np.nan,
+                "feasibility_rate": np.nan,
+                "wall_time": time.time() - start_time,
+                "error": "%s: %s" % (type(error).__name__, error)}
+
+
+def solve_instance(solver_name, instance_id, nodes_array):
+    cost_matrix = TSP_utilities.get_tsp_matrix(nodes_array)
+    start_time = time.time()
+    solution, feasibility_rate = SOLVERS[solver_name](nodes_array, cost_matrix)
+    wall_time = time.time() - start_time
+
+    if solver_name == "exact":
+        optimal_cost = TSP_utilities.calculate_cost(cost_matrix, solution)
+    elif len(nodes_array) <= MAX_NODES_FOR_OPTIMAL_COST:
+        optimal_solution = TSP_utilities.solve_tsp_dynamic_programming(nodes_array, 0, cost_matrix=cost_matrix,
+                                                                       verbose=False)
+        optimal_cost = TSP_utilities.calculate_cost(cost_matrix, optimal_solution)
+    else:
+        optimal_cost = np.nan
+    if solution is None:
+        solution = []
+        cost = np.nan
+    else:
+        cost = TSP_utilities.calculate_cost(cost_matrix, solution)
+
+    return {"instance_id": instance_id,
+            "solver": solver_name,
+            "tour": np.array(solution, dtype=np.int32),
+            "cost": cost,
+            "optimal_cost": optimal_cost,
+            "optimality_gap": (cost - optimal_cost) / optimal_cost,
+            "feasibility_rate": feasibility_rate,
+            "wall_time": wall_time,
+            "error": ""}
+
+
+class ResultStore(object):
+    """
+    Append-only store of results, kept as NPZ shards in one directory.
+    Each shard holds columns: instance_id, solver, cost, optimal_cost, optimality_gap,
+    feasibility_rate, wall_time, error (empty for solved instances) and tours,
+    flattened together with tour_lengths.
+    Shards are written to a temporary file and renamed, so a crash never
+    leaves a partially written shard behind.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def get_shard_paths(self):
+        return sorted(glob.glob(os.path.join(self.directory, "shard_*.npz")))
+
+    def append(self, records):
+        if not records:
+            return
+        shard_path = os.path.join(self.directory, "shard_%06d.npz" % len(self.get_shard_paths()))
+        temporary_path = shard_path + ".tmp"
+        with open(temporary_path, "wb") as shard_file:
+            np.savez(shard_file,
+                     instance_id=np.array([record["instance_id"] for record in records]),
+                     solver=np.array([record["solver"] for record in records]),
+                     tours=np.concatenate([record["tour"] for record in records]).astype(np.int32),
+                     tour_lengths=np.array([len(record["tour"]) for record in records], dtype=np.int32),
+                     error=np.array([record["error"] for record in records]),
+                     **{column: np.array([record[column] for record in records], dtype=float)
+                        for column in ["cost", "optimal_cost", "optimality_gap", "feasibility_rate", "wall_time"]})
+        os.replace(temporary_path, shard_path)
+
+    def load(self):
+        """
+        Returns all the results as a dictionary of concatenated columns;
+        "tours" is a list of arrays.
+        """
+        columns = {}
+        for shard_path in self.get_shard_paths():
+            with np.load(shard_path) as shard:
+                for column in shard.files:
+                    columns.setdefault(column, []).append(shard[column])
+        if not columns:
+            return {}
+        results = {column: np.concatenate(values) for column, values in columns.items()}
+        tours = results.pop("tours")
+        results["tours"] = np.split(tours, np.cumsum(results.pop("tour_lengths"))[:-1])
+        return results
+
+    def get_completed(self):
+        """
+        Returns the set of (instance_id, solver) pairs already in the store.
+        """
+        results = self.load()
+        if not results:
+            return set()
+        return set(zip(results["instance_id"].tolist(), results["solver"].tolist()))
+
+
+def run_batch(instances, solver_names, store_directory, num_workers=1, shard_size=100):
+    """
+    Solves all the instances with every solver from solver_names, fanning
+    instances out across a process pool, and streams the results to a ResultStore
+    in shards of shard_size records. Pairs (instance, solver) already present
+    in the store are skipped, so an interrupted run can simply be restarted.
+    Failed instances are stored with their errors and are not retried.
+    """
+    store = ResultStore(store_directory)
+    completed = store.get_completed()
+    instances = list(instances)
+    for solver_name in solver_names:
+        pending = [(instance_id, nodes_array) for instance_id, nodes_array in instances
+                   if (instance_id, solver_name) not in completed]
+        print(solver_name + ":", len(pending), "instances to solve,", len(instances) - len(pending), "already done")
+        records = []
+        try:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=num_workers) as executor:
+                futures = [executor.submit(run_instance, solver_name, instance_id, nodes_array)
+                           for instance_id, nodes_array in pending]
+                for future in concurrent.futures.as_completed(futures):
+                    records.append(future.result())
+                    if len(records) >= shard_size:
+                        store.append(records)
+                        records = []
+        finally:
+            # Finished records are kept even if the pool breaks down.
+            store.append(records)
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Solves many TSP instances and stores the results.")
+    parser.add_argument("store", help="directory with the results")
+    parser.add_argument("--instances", help="directory with .npy files with coordinates of nodes")
+    parser.add_argument("--nodes", type=int, default=4, help="number of nodes of random instances")
+    parser.add_argument("--seeds", type=int, default=10, help="number of random instances (seeds 1, 2, ...)")
+    parser.add_argument("--solvers", nargs="+", default=["exact"], choices=sorted(SOLVERS))
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--shard-size", type=int, default=100)
+    args = parser.parse_args()
+
+    if args.instances is not None:
+        instances = load_instances(args.instances)
+    else:
+        instances = generate_instances(args.nodes, range(1, args.seeds + 1))
+    run_batch(instances, args.solvers, args.store, num_workers=args.workers, shard_size=args.shard_size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,247 @@
+import argparse
+import concurrent.futures
+import contextlib
+import io
+import json
+import multiprocessing
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+import TSP_utilities
+
+
+def get_nodes_and_matrix(number_of_nodes):
+    nodes_array = np.random.RandomState(number_of_nodes).rand(number_of_nodes, 2) * 10
+    return nodes_array, TSP_utilities.get_tsp_matrix(nodes_array)
+
+
+def run_quietly(function, *args, **kwargs):
+    # Solvers, which always print their solutions, would measure console output on small instances.
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args, **kwargs)
+
+
+def setup_get_tsp_matrix(number_of_nodes):
+    nodes_array, _ = get_nodes_and_matrix(number_of_nodes)
+    return lambda: TSP_utilities.get_tsp_matrix(nodes_array)
+
+
+def setup_calculate_cost(number_of_nodes):
+    _, cost_matrix = get_nodes_and_matrix(number_of_nodes)
+    tour = list(range(number_of_nodes))
+    return lambda: TSP_utilities.calculate_cost(cost_matrix, tour)
+
+
+def setup_calculate_costs(number_of_nodes):
+    _, cost_matrix = get_nodes_and_matrix(number_of_nodes)
+    tours = np.argsort(np.random.RandomState(0).rand(10000, number_of_nodes), axis=1)
+    return lambda: TSP_utilities.calculate_costs(cost_matrix, tours)
+
+
+def setup_brute_force(number_of_nodes):
+    nodes_array, cost_matrix = get_nodes_and_matrix(number_of_nodes)
+    return lambda: run_quietly(TSP_utilities.solve_tsp_brute_force, nodes_array, cost_matrix=cost_matrix)
+
+
+def setup_brute_force_from_given_node(number_of_nodes):
+    nodes_array, cost_matrix = get_nodes_and_matrix(number_of_nodes)
+    return lambda: run_quietly(TSP_utilities.solve_tsp_brute_force_from_given_node, nodes_array, 0,
+                               cost_matrix=cost_matrix)
+
+
+def setup_dynamic_programming(number_of_nodes):
+    nodes_array, cost_matrix = get_nodes_and_matrix(number_of_nodes)
+    return lambda: TSP_utilities.solve_tsp_dynamic_programming(nodes_array, 0, cost_matrix=cost_matrix,
+                                                               verbose=False)
+
+
+def setup_heuristic(number_of_nodes):
+    from heuristic_tsp_solver import HeuristicTSPSolver
+    _, cost_matrix = get_nodes_and_matrix(number_of_nodes)
+    return lambda: HeuristicTSPSolver(cost_matrix).solve_tsp()
+
+
+def setup_dwave_qubo(number_of_nodes):
+    from dwave_tsp_solver import DWaveTSPSolver
+    _, cost_matrix = get_nodes_and_matrix(number_of_nodes)
+    return lambda: DWaveTSPSolver(cost_matrix).qubo.to_bqm()
+
+
+def setup_dwave_decode_solution(number_of_nodes):
+    import dimod
+    from dwave_tsp_solver import DWaveTSPSolver
+    _, cost_matrix = get_nodes_and_matrix(number_of_nodes)
+    solver = DWaveTSPSolver(cost_matrix)
+    # 1000 reads, half of them valid tours and half of them random bitstrings.
+    random_generator = np.random.RandomState(0)
+    tours = np.argsort(random_generator.rand(500, number_of_nodes), axis=1)
+    valid_samples = np.zeros((500, number_of_nodes, number_of_nodes), dtype=np.int8)
+    valid_samples[np.arange(500)[:, np.newaxis], np.arange(number_of_nodes), tours] = 1
+    random_samples = random_generator.randint(0, 2, size=(500, number_of_nodes**2)).astype(np.int8)
+    samples = np.concatenate((valid_samples.reshape(500, -1), random_samples))
+    response = dimod.SampleSet.from_samples((samples, list(range(number_of_nodes**2))), dimod.BINARY,
+                                            random_generator.rand(1000))
+    return lambda: solver.decode_solution(response)
+
+
+def setup_forest_hamiltonians(number_of_nodes):
+    import tsp_hamiltonians
+    _, cost_matrix = get_nodes_and_matrix(number_of_nodes)
+
+    def build_hamiltonians():
+        tsp_hamiltonians.get_phase_separator_structure.cache_clear()
+        tsp_hamiltonians.get_mixer_arrays.cache_clear()
+        tsp_hamiltonians.create_phase_separator_arrays(cost_matrix, 0)
+        tsp_hamiltonians.get_mixer_arrays(number_of_nodes - 1)
+    return build_hamiltonians
+
+
+def setup_forest_qaoa_expectation(number_of_nodes):
+    from forest_tsp_solver import ForestTSPSolver
+    _, cost_matrix = get_nodes_and_matrix(number_of_nodes)
+    solver = ForestTSPSolver(cost_matrix, steps=2, backend="subspace")
+    betas, gammas = np.array([0.3, 0.7]), np.array([1.1, 0.4])
+    return lambda: solver.qaoa_inst.expectation(betas, gammas)
+
+
+# Benchmark name -> (setup function, numbers of nodes, numbers of nodes for --quick).
+# Setup functions take the number of nodes and return the function to measure.
+BENCHMARKS = {
+    "get_tsp_matrix": (setup_get_tsp_matrix, [10, 100, 1000, 3000], [10, 100]),
+    "calculate_cost": (setup_calculate_cost, [10, 100, 1000], [10, 100]),
+    "calculate_costs_10000_tours": (setup_calculate_costs, [10, 100], [10]),
+    "solve_tsp_brute_force": (setup_brute_force, [6, 7, 8, 9], [6, 7]),
+    "solve_tsp_brute_force_from_given_node": (setup_brute_force_from_given_node, [7, 8, 9, 10], [7, 8]),
+    "solve_tsp_dynamic_programming": (setup_dynamic_programming, [10, 13, 16], [8, 10]),
+    "heuristic_tsp_solver": (setup_heuristic, [100, 1000, 3000], [100, 1000]),
+    "dwave_qubo": (setup_dwave_qubo, [5, 10, 20, 30], [5, 10]),
+    "dwave_decode_solution": (setup_dwave_decode_solution, [5, 10, 20], [5, 10]),
+    "forest_hamiltonians": (setup_forest_hamiltonians, [4, 6, 8, 10], [4, 6]),
+    "forest_qaoa_expectation": (setup_forest_qaoa_expectation, [4, 5, 6, 7], [4, 5]),
+}
+
+
+def measure(benchmark_name, number_of_nodes, repeats):
+    """
+    Runs one benchmark case and returns its record. It is meant to run in a fresh
+    process, so that the peak RSS belongs to this case only. The first run is a warm-up
+    (imports, caches of the setup); timed runs are done without tracing and peak
+    of allocated memory comes from one extra run under tracemalloc.
+    """
+    setup, _, _ = BENCHMARKS[benchmark_name]
+    record = {"benchmark": benchmark_name, "nodes": number_of_nodes}
+    try:
+        function = setup(number_of_nodes)
+    except ImportError as error:
+        record["skipped"] = str(error)
+        return record
+
+    rss_before_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    function()
+    times = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start_time)
+    tracemalloc.start()
+    function()
+    _, peak_allocated = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    record["time"] = float(np.median(times))
+    record["times"] = times
+    record["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    record["rss_increase_mb"] = record["peak_rss_mb"] - rss_before_mb
+    record["peak_allocated_mb"] = peak_allocated / 2**20
+    return record
+
+
+def run_benchmarks(benchmark_names, quick=False, repeats=3):
+    """
+    Runs the benchmarks for all their numbers of nodes, each case in a separate
+    process, and returns the report as a dictionary.
+    """
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for benchmark_name in benchmark_names:
+        _, nodes, quick_nodes = BENCHMARKS[benchmark_name]
+        for number_of_nodes in (quick_nodes if quick else nodes):
+            with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                record = executor.submit(measure, benchmark_name, number_of_nodes, repeats).result()
+            results.append(record)
+            print_record(record)
+    return {"python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "results": results}
+
+
+def print_record(record):
+    if "skipped" in record:
+        print("%-40s n=%-5d skipped (%s)" % (record["benchmark"], record["nodes"], record["skipped"]))
+    else:
+        print("%-40s n=%-5d %10.5f s %9.1f MB RSS %9.1f MB allocated" % (
+            record["benchmark"], record["nodes"], record["time"], record["peak_rss_mb"], record["peak_allocated_mb"]))
+
+
+def compare_with_baseline(report, baseline, tolerance=0.5, minimal_time=1e-3):
+    """
+    Returns descriptions of regressions: cases at least (1 + tolerance) times
+    slower or allocating that much more memory than in the baseline, and cases
+    measured in the baseline, which are skipped or missing in the report.
+    Times shorter than minimal_time are too noisy to compare.
+    """
+    records = {(record["benchmark"], record["nodes"]): record for record in report["results"]}
+    regressions = []
+    for baseline_record in baseline["results"]:
+        if "skipped" in baseline_record:
+            continue
+        record = records.get((baseline_record["benchmark"], baseline_record["nodes"]))
+        case = baseline_record["benchmark"] + " n=" + str(baseline_record["nodes"])
+        if record is None:
+            regressions.append("%s: missing in the report" % case)
+            continue
+        if "skipped" in record:
+            regressions.append("%s: skipped (%s)" % (case, record["skipped"]))
+            continue
+        if record["time"] > minimal_time and record["time"] > (1 + tolerance) * baseline_record["time"]:
+            regressions.append("%s: time %.5f s, baseline %.5f s" % (case, record["time"], baseline_record["time"]))
+        if record["peak_allocated_mb"] > 1 and record["peak_allocated_mb"] > (1 + tolerance) * baseline_record["peak_allocated_mb"]:
+            regressions.append("%s: allocated %.1f MB, baseline %.1f MB" % (
+                case, record["peak_allocated_mb"], baseline_record["peak_allocated_mb"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures scaling of the solvers and utilities.")
+    parser.add_argument("--benchmarks", nargs="+", default=list(BENCHMARKS), choices=list(BENCHMARKS))
+    parser.add_argument("--quick", action="store_true", help="use only small numbers of nodes")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", default="benchmark_report.json", help="path of the JSON report")
+    parser.add_argument("--baseline", help="JSON report to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed relative slowdown")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.benchmarks, quick=args.quick, repeats=args.repeats)
+    with open(args.output, "w") as report_file:
+        json.dump(report, report_file, indent=2)
+    print("Report saved to", args.output)
+
+    if args.baseline is not None:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare_with_baseline(report, baseline, tolerance=args.tolerance)
+        if regressions:
+            print("REGRESSIONS:")
+            for regression in regressions:
+                print("  " + regression)
+            sys.exit(1)
+        print("No regressions compared to", args.baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+import concurrent.futures
+import itertools
+import numpy as np
+
+import TSP_utilities
+from heuristic_tsp_solver import HeuristicTSPSolver, get_neighbour_lists, improve_tour
+from tour_distribution import TourDistribution
+
+
+def solve_subproblem_exact(cost_matrix, starting_node):
+    return TSP_utilities.solve_tsp_dynamic_programming(None, starting_node, cost_matrix=cost_matrix, verbose=False)
+
+
+def solve_subproblem_heuristic(cost_matrix, starting_node):
+    solution, _ = HeuristicTSPSolver(cost_matrix, starting_node=starting_node).solve_tsp()
+    return solution
+
+
+def solve_subproblem_forest(cost_matrix, starting_node):
+    from forest_tsp_solver import ForestTSPSolver
+    solver = ForestTSPSolver(cost_matrix, starting_node=starting_node, backend="subspace", use_gradient=True)
+    solution, _ = solver.solve_tsp()
+    return solution
+
+
+def solve_subproblem_dwave(cost_matrix, starting_node):
+    from dwave_tsp_solver import DWaveTSPSolver
+    from samplers import SimulatedAnnealingSampler
+    solution, _ = DWaveTSPSolver(cost_matrix, sampler=SimulatedAnnealingSampler()).solve_tsp()
+    return solution
+
+
+# Every sub-solver takes (cost_matrix, starting_node) and returns a tour
+# (list of nodes) or None, if it has not found any.
+SUBSOLVERS = {"exact": solve_subproblem_exact,
+              "heuristic": solve_subproblem_heuristic,
+              "forest": solve_subproblem_forest,
+              "dwave": solve_subproblem_dwave}
+
+
+class DecompositionTSPSolver(object):
+    """
+    Class for solving big instances of Travelling Salesman Problem (with starting point)
+    with a solver for small ones (exact, heuristic, Forest QAOA or D-Wave).
+    The tour from HeuristicTSPSolver (or initial_tour) is cut into windows of
+    subproblem_size consecutive cities. The order of the cities inside of every
+    window is optimized with the sub-solver, keeping both ends of the window fixed
+    (see create_path_subproblem); windows share only their ends, so they are solved
+    concurrently in num_workers processes. Paths are stitched back only if they are
+    shorter, then the whole tour is refined with 2-opt and Or-opt. Windows are
+    alternately shifted by half of their length, so that their ends get optimized too,
+    until a round brings no improvement or max_rounds is reached.
+    With Forest the subproblem has subproblem_size + 1 nodes and subproblem_size^2 qubits,
+    with D-Wave (subproblem_size + 1)^2.
+    """
+    def __init__(self, distance_matrix, subproblem_size=5, subsolver="exact", starting_node=0,
+                 initial_tour=None, max_rounds=10, num_workers=1):
+        if subproblem_size < 4:
+            raise ValueError("Subproblems need at least 4 cities, to have 2 cities between the fixed ends.")
+        if subsolver not in SUBSOLVERS:
+            raise ValueError("Unknown subsolver: " + str(subsolver))
+        self.distance_matrix = np.asarray(distance_matrix, dtype=float)
+        self.subproblem_size = subproblem_size
+        self.subsolver = subsolver
+        self.starting_node = starting_node
+        self.initial_tour = initial_tour
+        self.max_rounds = max_rounds
+        self.num_workers = num_workers
+        self.number_of_subproblems = 0
+        self.number_of_improvements = 0
+        self.solution = None
+        self.distribution = None
+
+    def solve_tsp(self):
+        """
+        Returns a list containing the order of nodes, starting from the starting node,
+        and the distribution, which has only this tour.
+        """
+        number_of_nodes = len(self.distance_matrix)
+        if number_of_nodes <= self.subproblem_size:
+            tour = SUBSOLVERS[self.subsolver](self.distance_matrix, self.starting_node)
+            if tour is None:
+                tour, _ = HeuristicTSPSolver(self.distance_matrix, starting_node=self.starting_node).solve_tsp()
+        else:
+            tour = self.improve_with_windows()
+        tour = np.roll(tour, -int(np.flatnonzero(np.asarray(tour) == self.starting_node)[0]))
+        self.solution = [int(node) for node in tour]
+        self.distribution = TourDistribution([self.solution], cost_matrix=self.distance_matrix)
+        return self.solution, self.distribution
+
+    def improve_with_windows(self):
+        if self.initial_tour is None:
+            tour, _ = HeuristicTSPSolver(self.distance_matrix, starting_node=self.starting_node).solve_tsp()
+        else:
+            tour = self.initial_tour
+        tour = np.array(tour, dtype=np.int64)
+        neighbours = get_neighbour_lists(self.distance_matrix)
+        offsets = [0, (self.subproblem_size - 1) // 2]
+        executor = None
+        if self.num_workers > 1:
+            executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.num_workers)
+        try:
+            for _ in range(self.max_rounds):
+                improved = False
+                for offset in offsets:
+                    improved |= self.improve_windows(tour, get_windows(len(tour), self.subproblem_size, offset), executor)
+                if not improved:
+                    break
+                tour = improve_tour(self.distance_matrix, tour, neighbours)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        return tour
+
+    def improve_windows(self, tour, windows, executor):
+        """
+        Optimizes paths in given windows (arrays of positions in the tour) and
+        replaces them in tour, if they got shorter. Returns True if any of them did.
+        """
+        paths = [tour[window] for window in windows]
+        cost_matrices = [self.distance_matrix[np.ix_(path, path)] for path in paths]
+        if executor is None:
+            orders = [solve_path(self.subsolver, cost_matrix) for cost_matrix in cost_matrices]
+        else:
+            orders = list(executor.map(solve_path, itertools.repeat(self.subsolver), cost_matrices))
+        self.number_of_subproblems += len(windows)
+
+        improved = False
+        for window, path, cost_matrix, order in zip(windows, paths, cost_matrices, orders):
+            if order is None:
+                continue
+            current_cost = get_path_cost(cost_matrix, np.arange(len(path)))
+            if get_path_cost(cost_matrix, order) < current_cost - 1e-10:
+                tour[window] = path[order]
+                self.number_of_improvements += 1
+                improved = True
+        return improved
+
+
+def get_windows(number_of_nodes, subproblem_size, offset=0):
+    """
+    Returns windows of subproblem_size consecutive positions in a tour of
+    number_of_nodes nodes, starting at offset. Neighbouring windows share one
+    position, the last one can be shorter and windows too short to change anything
+    (less than 2 positions between the ends) are skipped.
+    """
+    windows = []
+    for start in range(offset, offset + number_of_nodes - 1, subproblem_size - 1):
+        end = min(start + subproblem_size - 1, offset + number_of_nodes)
+        if end - start >= 3:
+            windows.append(np.arange(start, end + 1) % number_of_nodes)
+    return windows
+
+
+def create_path_subproblem(cost_matrix):
+    """
+    Turns the problem of the shortest path from the first to the last node,
+    going through all the other nodes, into TSP solvable with any solver: an extra
+    node (the last one, meant to be the starting node) is added with distance 0
+    to both ends of the path and a distance to all the other nodes, which is bigger
+    than the cost of any path, so optimal tours go end - extra node - end.
+    """
+    number_of_nodes = len(cost_matrix)
+    big_distance = number_of_nodes * np.max(cost_matrix)
+    subproblem = np.full((number_of_nodes + 1, number_of_nodes + 1), big_distance)
+    subproblem[:number_of_nodes, :number_of_nodes] = cost_matrix
+    subproblem[number_of_nodes, number_of_nodes] = 0
+    subproblem[[0, number_of_nodes - 1], number_of_nodes] = 0
+    subproblem[number_of_nodes, [0, number_of_nodes - 1]] = 0
+    return subproblem
+
+
+def solve_path(subsolver, cost_matrix):
+    """
+    Finds the shortest path through all the nodes of cost_matrix from the first to the last
+    one with given sub-solver. Returns the order of nodes or None if the sub-solver
+    has not returned a tour going through the ends and the extra node.
+    """
+    number_of_nodes = len(cost_matrix)
+    tour = SUBSOLVERS[subsolver](create_path_subproblem(cost_matrix), number_of_nodes)
+    if tour is None or sorted(tour) != list(range(number_of_nodes + 1)):
+        return None
+    tour = np.roll(tour, -int(np.flatnonzero(np.asarray(tour) == number_of_nodes)[0]))[1:]
+    if tour[0] == number_of_nodes - 1:
+        tour = tour[::-1]
+    if tour[0] != 0 or tour[-1] != number_of_nodes - 1:
+        return None
+    return tour
+
+
+def get_path_cost(cost_matrix, order):
+    return cost_matrix[order[:-1], order[1:]].sum()
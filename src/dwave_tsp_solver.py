@@ -1,18 +1,26 @@
-from dwave.system.samplers import DWaveSampler           # Library to interact with the QPU
-from dwave.system.composites import EmbeddingComposite   # Library to embed our problem onto the QPU physical graph
-
 import itertools
 import scipy.optimize
 import TSP_utilities
+from tsp_qubo import TSPQubo
+from profiling import Profiler
+from tour_distribution import TourDistribution
 import numpy as np
 
 class DWaveTSPSolver(object):
     """
     Class for solving Travelling Salesman Problem using DWave.
     Specifying starting point is not implemented.
+    By default the QUBO is sampled on the D-Wave QPU. Any other sampler with
+    a dimod-like sample(bqm, **kwargs) method returning a SampleSet
+    (e.g. samplers.SimulatedAnnealingSampler) can be passed instead.
+    Durations of the phases and memory usage are recorded if a profiling.Profiler is passed.
+    With an embedding_cache.EmbeddingCache the sampler has to be structured
+    (e.g. DWaveSampler, which is then created instead of EmbeddingComposite)
+    and the QUBO is embedded with a cached embedding instead of finding a new one.
     """
-    def __init__(self, distance_matrix, sapi_token=None, url=None):
+    def __init__(self, distance_matrix, sapi_token=None, url=None, sampler=None, profiler=None, embedding_cache=None):
 
+        self.cost_matrix = np.array(distance_matrix)
         max_distance = np.max(np.array(distance_matrix))
         scaled_distance_matrix = distance_matrix / max_distance
         self.distance_matrix = scaled_distance_matrix
@@ -20,75 +28,87 @@ class DWaveTSPSolver(object):
         self.cost_constant = 10
         self.chainstrength = 800
         self.numruns = 1000
-        self.qubo_dict = {}
         self.sapi_token = sapi_token
         self.url = url
-        self.add_cost_objective()
-        self.add_time_constraints()
-        self.add_position_constraints()
-
-
-    def add_cost_objective(self):
-        n = len(self.distance_matrix)
-        for t in range(n):
-            for i in range(n):
-                for j in range(n):
-                    if i == j:
-                        continue
-                    qubit_a = t * n + i
-                    qubit_b = (t + 1)%n * n + j
-                    self.qubo_dict[(qubit_a, qubit_b)] = self.cost_constant * self.distance_matrix[i][j]
-
-    def add_time_constraints(self):
-        n = len(self.distance_matrix)
-        for t in range(n):
-            for i in range(n):
-                qubit_a = t * n + i
-                if (qubit_a, qubit_a) not in self.qubo_dict.keys():
-                    self.qubo_dict[(qubit_a, qubit_a)] = -self.constraint_constant
-                else:
-                    self.qubo_dict[(qubit_a, qubit_a)] += -self.constraint_constant
-                for j in range(n):
-                    qubit_b = t * n + j
-                    if i!=j:
-                        self.qubo_dict[(qubit_a, qubit_b)] = 2 * self.constraint_constant
-
-
-    def add_position_constraints(self):
-        n = len(self.distance_matrix)
-        for i in range(n):
-            for t1 in range(n):
-                qubit_a = t1 * n + i
-                if (qubit_a, qubit_a) not in self.qubo_dict.keys():
-                    self.qubo_dict[(qubit_a, qubit_a)] = -self.constraint_constant
-                else:
-                    self.qubo_dict[(qubit_a, qubit_a)] += -self.constraint_constant
-                for t2 in range(n):
-                    qubit_b = t2 * n + i
-                    if t1!=t2:
-                        self.qubo_dict[(qubit_a, qubit_b)] = 2 * self.constraint_constant
-
+        self.sampler = sampler
+        self.embedding_cache = embedding_cache
+        self.solution = None
+        self.distribution = None
+        self.number_of_feasible_samples = 0
+        self.number_of_infeasible_samples = 0
+        if profiler is None:
+            profiler = Profiler(enabled=False)
+        self.profiler = profiler
+        with self.profiler.phase("dwave.qubo"):
+            self.qubo = TSPQubo(self.distance_matrix, self.cost_constant, self.constraint_constant)
 
+    @property
+    def qubo_dict(self):
+        """
+        Dictionary representation of the QUBO, built from self.qubo on first use.
+        """
+        return self.qubo.to_dict()
 
     def solve_tsp(self):
-        response = EmbeddingComposite(DWaveSampler(token=self.sapi_token, endpoint=self.url, solver='DW_2000Q_2_1')).sample_qubo(self.qubo_dict, chain_strength=self.chainstrength, num_reads=self.numruns)             
+        if self.sampler is None:
+            with self.profiler.phase("dwave.create_sampler"):
+                self.sampler = self.create_dwave_sampler()
+        sampler = self.sampler
+        if self.embedding_cache is not None:
+            with self.profiler.phase("dwave.embedding"):
+                sampler = self.embedding_cache.create_composite(self.sampler, len(self.distance_matrix))
+        with self.profiler.phase("dwave.bqm"):
+            bqm = self.qubo.to_bqm()
+        with self.profiler.phase("dwave.sampling"):
+            response = sampler.sample(bqm, chain_strength=self.chainstrength, num_reads=self.numruns)
+        self.profiler.count("samples", self.numruns)
         self.decode_solution(response)
         return self.solution, self.distribution
 
+    def create_dwave_sampler(self):
+        from dwave.system.samplers import DWaveSampler           # Library to interact with the QPU
+        from dwave.system.composites import EmbeddingComposite   # Library to embed our problem onto the QPU physical graph
+        if self.embedding_cache is not None:
+            return DWaveSampler(token=self.sapi_token, endpoint=self.url, solver='DW_2000Q_2_1')
+        return EmbeddingComposite(DWaveSampler(token=self.sapi_token, endpoint=self.url, solver='DW_2000Q_2_1'))
+
     def decode_solution(self, response):
-        n = len(self.distance_matrix)
-        distribution = {}
-        min_energy = response.record[0].energy
+        """
+        Decodes all the samples from the response at once.
+        Only samples, which encode a valid permutation, go to the distribution
+        (a TourDistribution with costs for the original distances); repeated tours
+        are merged, keeping the lowest energy and summing occurrences.
+        The solution is the tour with the lowest energy.
+        Numbers of feasible and infeasible reads are stored as well.
+        """
+        with self.profiler.phase("dwave.decode_solution"):
+            self._decode_solution(response)
 
-        for record in response.record:
-            sample = record[0]
-            solution_binary = [node for node in sample] 
-            solution = TSP_utilities.binary_state_to_points_order(solution_binary)
-            distribution[tuple(solution)] = (record.energy, record.num_occurrences)
-            if record.energy <= min_energy:
-                self.solution = solution
-        self.distribution = distribution
+    def _decode_solution(self, response):
+        record = response.record
+        # Columns are reordered, so that column q holds the value of qubit q.
+        columns = np.argsort(np.array(list(response.variables)))
+        samples = np.asarray(record.sample)[:, columns]
+        energies = np.asarray(record.energy, dtype=float)
+        occurrences = np.asarray(record.num_occurrences, dtype=int)
 
+        tours, feasible = TSP_utilities.binary_states_to_points_orders(samples)
+        self.number_of_feasible_samples = int(occurrences[feasible].sum())
+        self.number_of_infeasible_samples = int(occurrences[~feasible].sum())
+
+        self.distribution = TourDistribution(tours[feasible], occurrences[feasible], energies[feasible],
+                                             cost_matrix=self.cost_matrix,
+                                             number_of_infeasible_samples=self.number_of_infeasible_samples)
+        self.solution = self.distribution.get_lowest_energy_tour()
+
+    def get_feasibility_rate(self):
+        """
+        Returns the fraction of reads, which encoded a valid tour.
+        """
+        number_of_samples = self.number_of_feasible_samples + self.number_of_infeasible_samples
+        if number_of_samples == 0:
+            return 0.0
+        return self.number_of_feasible_samples / number_of_samples
 
     def calculate_solution(self):
         """
@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+import numpy as np
+
+from json_store import load_json, save_json
+from tsp_qubo import TSPQubo
+
+
+class EmbeddingCache(object):
+    """
+    Cache of minor-embeddings of the TSP QUBO into hardware graphs.
+    Couplings of the QUBO depend only on the number of nodes, not on the distances,
+    so one embedding serves every instance of the same size. Embeddings are keyed
+    by (number of nodes, hash of the target graph), kept in memory and, if directory
+    is given, saved there as JSON files, so they are reused between runs.
+    New embeddings are found with minorminer.find_embedding, which gets
+    embedding_parameters (e.g. random_seed, timeout).
+    """
+    def __init__(self, directory=None, **embedding_parameters):
+        self.directory = directory
+        self.embedding_parameters = embedding_parameters
+        self.embeddings = {}
+        self.hits = 0
+        self.misses = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def get_embedding(self, number_of_nodes, target_edges):
+        """
+        Returns the embedding {qubit of the QUBO: chain of target nodes} for TSP
+        with given number of nodes, finding it only if it is not in the cache yet.
+        """
+        key = (number_of_nodes, get_graph_hash(target_edges))
+        if key not in self.embeddings:
+            embedding = self.load(key)
+            if embedding is None:
+                self.misses += 1
+                embedding = self.find_embedding(number_of_nodes, target_edges)
+                self.save(key, embedding)
+            else:
+                self.hits += 1
+            self.embeddings[key] = embedding
+        else:
+            self.hits += 1
+        return self.embeddings[key]
+
+    def find_embedding(self, number_of_nodes, target_edges):
+        import minorminer
+        embedding = minorminer.find_embedding(get_tsp_qubo_edges(number_of_nodes), list(target_edges),
+                                              **self.embedding_parameters)
+        if not embedding:
+            raise ValueError("No embedding found for TSP with " + str(number_of_nodes) + " nodes.")
+        return {int(qubit): [int(node) for node in chain] for qubit, chain in embedding.items()}
+
+    def get_path(self, key):
+        number_of_nodes, graph_hash = key
+        return os.path.join(self.directory, "tsp_%d_%s.json" % (number_of_nodes, graph_hash))
+
+    def load(self, key):
+        if self.directory is None:
+            return None
+        embedding = load_json(self.get_path(key))
+        if embedding is None:
+            return None
+        return {int(qubit): chain for qubit, chain in embedding.items()}
+
+    def save(self, key, embedding):
+        if self.directory is not None:
+            save_json(self.get_path(key), embedding)
+
+    def create_composite(self, structured_sampler, number_of_nodes):
+        """
+        Wraps a structured sampler (e.g. DWaveSampler or dimod.StructureComposite
+        with a dwave_networkx graph) in FixedEmbeddingComposite with the cached embedding.
+        """
+        from dwave.system.composites import FixedEmbeddingComposite
+        embedding = self.get_embedding(number_of_nodes, structured_sampler.edgelist)
+        return FixedEmbeddingComposite(structured_sampler, embedding)
+
+
+def get_tsp_qubo_edges(number_of_nodes):
+    """
+    Returns the list of couplings (qubit_a, qubit_b), qubit_a < qubit_b,
+    of the TSP QUBO for given number of nodes (for distinct cities).
+    """
+    distance_matrix = np.ones((number_of_nodes, number_of_nodes)) - np.eye(number_of_nodes)
+    qubo = TSPQubo(distance_matrix, 1, 1)
+    edges = np.unique(np.sort(np.column_stack((qubo.rows, qubo.cols)), axis=1), axis=0)
+    return [tuple(edge) for edge in edges.tolist()]
+
+
+def get_graph_hash(edges):
+    """
+    Returns a short hash of a graph given by its edges, independent
+    of the order of the edges and of nodes within them.
+    """
+    normalized_edges = sorted(sorted(edge) for edge in edges)
+    return hashlib.sha256(json.dumps(normalized_edges).encode()).hexdigest()[:16]
@@ -2,29 +2,51 @@ import pyquil.api as api
 import numpy as np
 from grove.pyqaoa.qaoa import QAOA
 from grove.alpha.arbitrary_state.arbitrary_state import create_arbitrary_state
-from pyquil.paulis import PauliTerm, PauliSum
+from pyquil.paulis import PauliTerm
 import pyquil.quil as pq
 from pyquil.gates import X
-import itertools
 
 import scipy.optimize
 import TSP_utilities
+from qaoa_simulator import StatevectorQAOA, get_permutation_basis_states
+from qaoa_simulator import get_angles_multistart, interpolate_angles
+import tsp_hamiltonians
+from profiling import Profiler, counting_minimizer
+from tour_distribution import TourDistribution
 import pdb
 
+# Compiled programs preparing the superposition of all permutations, keyed by the reduced number of nodes.
+INITIAL_STATE_PROGRAMS = {}
+
 class ForestTSPSolver(object):
     """
     Class for solving Travelling Salesman Problem (with starting point) using Forest - quantum computing library.
     It uses QAOA method with operators as described in the following paper:
     https://arxiv.org/pdf/1709.03489.pdf by Stuart Hadfield et al.
+    With backend="qvm" the algorithm runs on the Forest QVM through grove,
+    with backend="statevector" it is simulated in-process with NumPy.
+    backend="subspace" simulates only the (n-1)! basis states encoding permutations,
+    which is exact, because the mixer never leaves this subspace;
+    it requires initial_state to be "all" or a list.
+    Simulator backends can optimize angles with exact gradients (use_gradient=True),
+    from many starting points and layer by layer.
+    Durations of the phases of the algorithm, numbers of objective evaluations
+    and memory usage are recorded if a profiling.Profiler is passed.
+    With an angle_store.AngleStore, angles found for similar instances are used as
+    the starting point of the optimization, which is limited to refinement_iterations
+    iterations (skipped for 0, unlimited for None); new optimal angles are stored.
     
     """
-    def __init__(self, distance_matrix, steps=2, ftol=1.0e-3, xtol=1.0e-3, initial_state="all", starting_node=0):
+    def __init__(self, distance_matrix, steps=2, ftol=1.0e-3, xtol=1.0e-3, initial_state="all", starting_node=0, backend="qvm", use_gradient=False, profiler=None,
+                 angle_store=None, refinement_iterations=None):
 
         self.distance_matrix = distance_matrix
         self.starting_node = starting_node
         # Since we fixed the starting city, the effective number of nodes is smaller by 1
         self.reduced_number_of_nodes = len(self.distance_matrix) - 1
-        self.qvm = api.QVMConnection()
+        self.backend = backend
+        self.use_gradient = use_gradient
+        self.qvm = None
         self.steps = steps
         self.ftol = ftol
         self.xtol = xtol
@@ -34,33 +56,102 @@ class ForestTSPSolver(object):
         self.number_of_qubits = self.get_number_of_qubits()
         self.solution = None
         self.distribution = None
-
-        cost_operators = self.create_phase_separator()
-        driver_operators = self.create_mixer()
-        initial_state_program = self.create_initial_state_program(initial_state)
+        self.angles_reports = []
+        self.initial_state_type = "all" if initial_state == "all" else "list"
+        self.angle_store = angle_store
+        self.refinement_iterations = refinement_iterations
+        self.angles_from_store = False
+        if profiler is None:
+            profiler = Profiler(enabled=False)
+        self.profiler = profiler
+        # Hamiltonians are kept as coefficient arrays and turned into PauliSums only for the QVM.
+        with self.profiler.phase("forest.hamiltonians"):
+            self.phase_separator_arrays = tsp_hamiltonians.create_phase_separator_arrays(self.distance_matrix, self.starting_node)
+            self.mixer_arrays = tsp_hamiltonians.get_mixer_arrays(self.reduced_number_of_nodes)
 
         minimizer_kwargs = {'method': 'Nelder-Mead',
                                 'options': {'ftol': self.ftol, 'xtol': self.xtol,
                                             'disp': False}}
+        if self.use_gradient:
+            minimizer_kwargs = {'method': 'BFGS', 'jac': True,
+                                'options': {'gtol': self.ftol, 'disp': False}}
+        elif self.backend != "qvm":
+            # scipy's Nelder-Mead reads the tolerances as fatol and xatol and ignores ftol and xtol.
+            minimizer_kwargs = {'method': 'Nelder-Mead',
+                                'options': {'fatol': self.ftol, 'xatol': self.xtol,
+                                            'disp': False}}
+
+        if self.backend == "qvm" and self.use_gradient:
+            raise ValueError("Gradients are available only for simulator backends.")
+        elif self.backend not in ["qvm", "statevector", "subspace"]:
+            raise ValueError("Unknown backend: " + str(self.backend))
+
+        with self.profiler.phase("forest.create_qaoa"):
+            if self.backend == "qvm":
+                self.qaoa_inst = self.create_qvm_qaoa(initial_state, minimizer_kwargs)
+            else:
+                self.qaoa_inst = self.create_statevector_qaoa(initial_state, minimizer_kwargs, subspace=self.backend == "subspace")
+
+    def create_qvm_qaoa(self, initial_state, minimizer_kwargs):
+        """
+        Creates grove's QAOA, which runs on the QVM.
+        Messages of the VQE are not printed; the profiler counts objective
+        evaluations and iterations instead.
+        """
+        with self.profiler.phase("forest.pauli_sums"):
+            cost_operators = self.create_phase_separator()
+            driver_operators = self.create_mixer()
+        self.qvm = api.QVMConnection()
+        with self.profiler.phase("forest.initial_state_program"):
+            initial_state_program = self.create_initial_state_program(initial_state)
 
-        vqe_option = {'disp': print_fun, 'return_all': True,
+        vqe_option = {'disp': ignore_message, 'return_all': True,
                       'samples': None}
 
         qubits=list(range(self.number_of_qubits));
 
-        self.qaoa_inst = QAOA(self.qvm, 
-                              qubits, 
-                              steps=self.steps, 
-                              init_betas=None, 
-                              init_gammas=None,
-                              cost_ham=cost_operators,
-                              ref_ham=driver_operators, 
-                              driver_ref=initial_state_program,
-                              minimizer=scipy.optimize.minimize,
-                              minimizer_kwargs=minimizer_kwargs,
-                              rand_seed=None,
-                              vqe_options=vqe_option, 
-                              store_basis=True)
+        return QAOA(self.qvm, 
+                    qubits, 
+                    steps=self.steps, 
+                    init_betas=None, 
+                    init_gammas=None,
+                    cost_ham=cost_operators,
+                    ref_ham=driver_operators, 
+                    driver_ref=initial_state_program,
+                    minimizer=counting_minimizer(self.profiler, scipy.optimize.minimize),
+                    minimizer_kwargs=minimizer_kwargs,
+                    rand_seed=None,
+                    vqe_options=vqe_option, 
+                    store_basis=True)
+
+    def create_statevector_qaoa(self, initial_state, minimizer_kwargs, subspace=False):
+        """
+        Creates a NumPy statevector simulation of the QAOA, which does not need the QVM.
+        The phase separator is precomputed as a vector of energies of the basis states
+        and mixing operators as sparse matrices (cached for every number of nodes).
+        By default all 2^q basis states are used, with subspace=True only the permutation ones.
+        """
+        if subspace:
+            basis_states, _ = get_permutation_basis_states(self.reduced_number_of_nodes)
+        else:
+            basis_states = None
+        with self.profiler.phase("forest.cost_vector"):
+            cost_vector = self.phase_separator_arrays.to_diagonal(
+                basis_states if subspace else np.arange(2**self.number_of_qubits))
+        with self.profiler.phase("forest.mixer_matrices"):
+            mixer_matrices, mixer_eigensystems = tsp_hamiltonians.get_mixer_matrices(self.reduced_number_of_nodes, subspace)
+        with self.profiler.phase("forest.initial_state_vector"):
+            initial_state_vector = self.create_initial_state_vector(initial_state, basis_states)
+        return StatevectorQAOA(cost_vector,
+                               mixer_matrices,
+                               initial_state_vector,
+                               steps=self.steps,
+                               minimizer=scipy.optimize.minimize,
+                               minimizer_kwargs=minimizer_kwargs,
+                               number_of_qubits=self.number_of_qubits,
+                               basis_states=basis_states,
+                               use_gradient=self.use_gradient,
+                               mixer_eigensystems=mixer_eigensystems)
         
     def solve_tsp(self):
         """
@@ -71,36 +162,130 @@ class ForestTSPSolver(object):
         self.calculate_solution()
         return self.solution, self.distribution
 
-    def find_angles(self):
+    def find_angles(self, number_of_starts=1, num_workers=1):
         """
         Runs the QAOA algorithm for finding the optimal angles.
+        For simulator backends it can start from number_of_starts random angles,
+        running them in num_workers processes, and keep the best result.
+        Reports of the optimizations are stored in self.angles_reports.
+        If the angle store has angles for a similar instance, they replace
+        the random starting points.
+        """
+        if number_of_starts != 1 and self.backend == "qvm":
+            raise ValueError("Multiple starting points are available only for simulator backends.")
+        stored_angles = None
+        if self.angle_store is not None:
+            stored_angles = self.angle_store.get_angles(self.distance_matrix, self.steps, self.initial_state_type)
+            self.profiler.count("angle_store_hits" if stored_angles is not None else "angle_store_misses")
+        self.angles_from_store = stored_angles is not None
+        with self.profiler.phase("forest.find_angles"):
+            if stored_angles is not None:
+                self.refine_angles(*stored_angles)
+            elif number_of_starts == 1:
+                self.betas, self.gammas = self.qaoa_inst.get_angles()
+                self.angles_reports = getattr(self.qaoa_inst, 'reports', [])[-1:]
+            else:
+                self.betas, self.gammas, self.angles_reports = get_angles_multistart(self.qaoa_inst, number_of_starts, num_workers)
+        self.count_optimization_steps()
+        if self.angle_store is not None and (stored_angles is None or self.refinement_iterations != 0):
+            self.angle_store.put_angles(self.distance_matrix, self.steps, self.initial_state_type, self.betas, self.gammas)
+        return self.betas, self.gammas
+
+    def refine_angles(self, betas, gammas):
+        """
+        Optimizes angles starting from given ones, with at most self.refinement_iterations
+        iterations of the minimizer; for 0 the angles are used as they are.
+        """
+        self.angles_reports = []
+        if self.refinement_iterations == 0:
+            self.betas, self.gammas = np.array(betas), np.array(gammas)
+            return
+        minimizer_kwargs = self.qaoa_inst.minimizer_kwargs
+        if self.refinement_iterations is not None:
+            options = dict(minimizer_kwargs.get('options', {}), maxiter=self.refinement_iterations)
+            self.qaoa_inst.minimizer_kwargs = dict(minimizer_kwargs, options=options)
+        try:
+            if self.backend == "qvm":
+                # grove's QAOA starts from its betas and gammas attributes.
+                self.qaoa_inst.betas, self.qaoa_inst.gammas = list(betas), list(gammas)
+                self.betas, self.gammas = self.qaoa_inst.get_angles()
+            else:
+                self.betas, self.gammas = self.qaoa_inst.get_angles(betas, gammas)
+                self.angles_reports = self.qaoa_inst.reports[-1:]
+        finally:
+            self.qaoa_inst.minimizer_kwargs = minimizer_kwargs
+
+    def find_angles_layer_by_layer(self):
+        """
+        Finds the optimal angles for 1, 2, ..., self.steps layers (simulator backends only).
+        Each optimization starts from the optimum for one layer less,
+        interpolated to one more layer, instead of random angles.
         """
-        self.betas, self.gammas = self.qaoa_inst.get_angles()
+        if self.backend == "qvm":
+            raise ValueError("Warm starts are available only for simulator backends.")
+        self.angles_reports = []
+        betas, gammas = self.qaoa_inst.get_random_angles(1)
+        with self.profiler.phase("forest.find_angles"):
+            for steps in range(1, self.steps + 1):
+                if steps > 1:
+                    betas, gammas = interpolate_angles(betas, gammas)
+                betas, gammas = self.qaoa_inst.get_angles(betas, gammas)
+                self.angles_reports.append(self.qaoa_inst.reports[-1])
+        self.count_optimization_steps()
+        self.betas, self.gammas = betas, gammas
         return self.betas, self.gammas
 
-    def calculate_solution(self):
+    def count_optimization_steps(self):
+        """
+        Passes numbers of objective evaluations and iterations from the reports
+        of the simulator backends to the profiler (for the QVM they are counted
+        by the minimizer itself). Reports also cover optimizations run in other processes.
+        """
+        for report in self.angles_reports:
+            self.profiler.count("objective_evaluations", report['function_evaluations'])
+            self.profiler.count("optimizer_iterations", report['iterations'])
+
+    def calculate_solution(self, number_of_samples=10000, batch_size=None):
         """
         Samples the QVM for the results of the algorithm 
         and returns a list containing the order of nodes.
+        Samples are drawn in batches of batch_size (by default all at once) and
+        merged into a TourDistribution; samples, which do not encode a tour, are only counted.
+        The solution is the most frequent tour (None if no sample was a tour).
         """
-        most_frequent_string, sampling_results = self.qaoa_inst.get_string(self.betas, self.gammas, samples=10000)
-        reduced_solution = TSP_utilities.binary_state_to_points_order(most_frequent_string)
-        full_solution = self.get_solution_for_full_array(reduced_solution)
-        self.solution = full_solution
-        
-        all_solutions = sampling_results.keys()
-        distribution = {}
-        for sol in all_solutions:
-            reduced_sol = TSP_utilities.binary_state_to_points_order(sol)
-            full_sol = self.get_solution_for_full_array(reduced_sol)
-            distribution[tuple(full_sol)] = sampling_results[sol]
+        if batch_size is None:
+            batch_size = number_of_samples
+        distribution = TourDistribution(cost_matrix=np.asarray(self.distance_matrix))
+        for start in range(0, number_of_samples, batch_size):
+            samples = min(batch_size, number_of_samples - start)
+            with self.profiler.phase("forest.sampling"):
+                _, sampling_results = self.qaoa_inst.get_string(self.betas, self.gammas, samples=samples)
+            self.profiler.count("samples", samples)
+            with self.profiler.phase("forest.decoding"):
+                bitstrings = np.array(list(sampling_results.keys()), dtype=np.int8)
+                counts = np.array(list(sampling_results.values()), dtype=np.int64)
+                reduced_tours, feasible = TSP_utilities.binary_states_to_points_orders(bitstrings)
+                distribution.add(self.get_solutions_for_full_array(reduced_tours[feasible]), counts[feasible],
+                                 number_of_infeasible_samples=int(counts[~feasible].sum()))
         self.distribution = distribution
+        self.solution = distribution.get_most_frequent_tour()
+        return self.solution
+
+    def get_solutions_for_full_array(self, reduced_solutions):
+        """
+        Vectorized version of get_solution_for_full_array for an (m, n - 1) array of solutions.
+        """
+        reduced_solutions = np.asarray(reduced_solutions)
+        full_solutions = reduced_solutions + (reduced_solutions >= self.starting_node)
+        starting_nodes = np.full((len(reduced_solutions), 1), self.starting_node)
+        return np.hstack((starting_nodes, full_solutions))
 
     def get_solution_for_full_array(self, reduced_solution):
         """
         Transforms the solution from its reduced version to the full initial version.
+        The reduced solution is not modified.
         """
-        full_solution = reduced_solution
+        full_solution = list(reduced_solution)
         for i in range(len(full_solution)):
             if full_solution[i] >= self.starting_node:
                 full_solution[i] += 1
@@ -110,61 +295,17 @@ class ForestTSPSolver(object):
     def create_phase_separator(self):
         """
         Creates phase-separation operators, which depend on the objective function.
+        Terms are built in tsp_hamiltonians.get_phase_separator_structure.
         """
-        cost_operators = []
-        reduced_distance_matrix = np.delete(self.distance_matrix, self.starting_node, axis=0)
-        reduced_distance_matrix = np.delete(reduced_distance_matrix, self.starting_node, axis=1)
-        for t in range(self.reduced_number_of_nodes - 1):
-            for city_1 in range(self.reduced_number_of_nodes):
-                for city_2 in range(self.reduced_number_of_nodes):
-                    if city_1 != city_2:
-                        distance = reduced_distance_matrix[city_1, city_2]
-                        qubit_1 = t * (self.reduced_number_of_nodes) + city_1
-                        qubit_2 = (t + 1) * (self.reduced_number_of_nodes) + city_2
-                        cost_operators.append(PauliTerm("Z", qubit_1, distance) * PauliTerm("Z", qubit_2))
-
-        costs_to_starting_node = np.delete(self.distance_matrix[:, self.starting_node], self.starting_node)
-
-        for city in range(self.reduced_number_of_nodes):
-            distance_from_0 = -costs_to_starting_node[city]
-            qubit = city
-            cost_operators.append(PauliTerm("Z", qubit, distance_from_0))
-
-        for city in range(self.reduced_number_of_nodes):
-            distance_from_0 = -costs_to_starting_node[city]
-            qubit = self.number_of_qubits - (self.reduced_number_of_nodes) + city
-            cost_operators.append(PauliTerm("Z", qubit, distance_from_0))
-
-        phase_separator = [PauliSum(cost_operators)]
-        return phase_separator
+        return self.phase_separator_arrays.to_pauli_sums()
 
     def create_mixer(self):
         """
         Creates mixing operators, which depend on the structure of the problem.
         Indexing comes directly from 4.1.2 from the  https://arxiv.org/pdf/1709.03489.pdf article, 
-        equations 54 - 58.
-        """
-        mixer_operators = []
-
-        for t in range(self.reduced_number_of_nodes - 1):
-            for city_1 in range(self.reduced_number_of_nodes):
-                for city_2 in range(self.reduced_number_of_nodes):
-                    i = t
-                    u = city_1
-                    v = city_2
-                    first_part = 1
-                    first_part *= self.s_plus(u, i)
-                    first_part *= self.s_plus(v, i+1)
-                    first_part *= self.s_minus(u, i+1)
-                    first_part *= self.s_minus(v, i)
-
-                    second_part = 1
-                    second_part *= self.s_minus(u, i)
-                    second_part *= self.s_minus(v, i+1)
-                    second_part *= self.s_plus(u, i+1)
-                    second_part *= self.s_plus(v, i)
-                    mixer_operators.append(first_part + second_part)
-        return mixer_operators
+        equations 54 - 58. Terms are built in tsp_hamiltonians.get_mixer_arrays.
+        """
+        return self.mixer_arrays.to_pauli_sums()
 
     def create_initial_state_program(self, initial_state):
         """
@@ -179,19 +320,44 @@ class ForestTSPSolver(object):
                 initial_state_program.inst(X(i * (self.reduced_number_of_nodes) + initial_state[i]))
 
         elif initial_state == "all":
-            vector_of_states = np.zeros(2**self.number_of_qubits)
-            list_of_possible_states = []
-            initial_order = range(0, self.reduced_number_of_nodes)
-            all_permutations = [list(x) for x in itertools.permutations(initial_order)]
-            for permutation in all_permutations:
-                coding_of_permutation = 0
-                for i in range(len(permutation)):
-                    coding_of_permutation += 2**(i * (self.reduced_number_of_nodes) + permutation[i])
-                vector_of_states[coding_of_permutation] = 1
-            initial_state_program = create_arbitrary_state(vector_of_states)
+            # The superposition of all permutations depends only on the number of nodes,
+            # so its (exponentially deep) program is compiled once and then copied.
+            if self.reduced_number_of_nodes not in INITIAL_STATE_PROGRAMS:
+                vector_of_states = self.create_initial_state_vector(initial_state)
+                INITIAL_STATE_PROGRAMS[self.reduced_number_of_nodes] = create_arbitrary_state(vector_of_states)
+            initial_state_program = INITIAL_STATE_PROGRAMS[self.reduced_number_of_nodes].copy()
 
         return initial_state_program
 
+    def create_initial_state_vector(self, initial_state, basis_states=None):
+        """
+        Creates the (unnormalized) vector of amplitudes of the initial state.
+        Arguments are the same as for create_initial_state_program.
+        If sorted basis_states are given, amplitudes are returned only for them;
+        they are assumed to be the permutation states from get_permutation_basis_states,
+        so "all" is simply a vector of ones.
+        """
+        if initial_state == "all" and basis_states is not None:
+            return np.ones(len(basis_states))
+
+        codings_of_states = []
+        if type(initial_state) is list:
+            coding_of_state = 0
+            for i in range(self.reduced_number_of_nodes):
+                coding_of_state += 2**(i * (self.reduced_number_of_nodes) + initial_state[i])
+            codings_of_states.append(coding_of_state)
+
+        elif initial_state == "all":
+            codings_of_states, _ = get_permutation_basis_states(self.reduced_number_of_nodes)
+
+        if basis_states is None:
+            vector_of_states = np.zeros(2**self.number_of_qubits)
+            vector_of_states[codings_of_states] = 1
+        else:
+            vector_of_states = np.zeros(len(basis_states))
+            vector_of_states[np.searchsorted(basis_states, codings_of_states)] = 1
+        return vector_of_states
+
     def get_number_of_qubits(self):
         return (self.reduced_number_of_nodes)**2
 
@@ -204,5 +370,5 @@ class ForestTSPSolver(object):
         return PauliTerm("X", qubit) - PauliTerm("Y", qubit, 1j)
 
 
-def print_fun(x):
-    print(x)
+def ignore_message(message):
+    pass
@@ -0,0 +1,211 @@
+import collections
+import numpy as np
+
+from tour_distribution import TourDistribution
+
+
+class HeuristicTSPSolver(object):
+    """
+    Class for solving Travelling Salesman Problem (with starting point) with classical heuristics.
+    The tour is built with the nearest neighbour heuristic and then improved with
+    2-opt and Or-opt moves (see improve_tour) until no improving move is left.
+    It handles thousands of nodes, so it can be used for instances too big for
+    the exact and quantum solvers, as a reference for their results and to create
+    initial states for ForestTSPSolver (see get_initial_state).
+    The moves assume symmetric distances, so asymmetric matrices are rejected.
+    """
+    def __init__(self, distance_matrix, starting_node=0, number_of_neighbours=8, use_or_opt=True):
+        self.distance_matrix = np.asarray(distance_matrix, dtype=float)
+        if not np.allclose(self.distance_matrix, self.distance_matrix.T):
+            raise ValueError("HeuristicTSPSolver requires a symmetric distance matrix.")
+        self.starting_node = starting_node
+        self.number_of_neighbours = number_of_neighbours
+        self.use_or_opt = use_or_opt
+        self.solution = None
+        self.distribution = None
+
+    def solve_tsp(self):
+        """
+        Returns a list containing the order of nodes, starting from the starting node,
+        and the distribution, which for this deterministic solver has only this tour.
+        """
+        tour = get_nearest_neighbour_tour(self.distance_matrix, self.starting_node)
+        neighbours = get_neighbour_lists(self.distance_matrix, self.number_of_neighbours)
+        tour = improve_tour(self.distance_matrix, tour, neighbours, use_or_opt=self.use_or_opt)
+        tour = np.roll(tour, -int(np.flatnonzero(tour == self.starting_node)[0]))
+        self.solution = tour.tolist()
+        self.distribution = TourDistribution([self.solution], cost_matrix=self.distance_matrix)
+        return self.solution, self.distribution
+
+    def get_initial_state(self):
+        """
+        Returns the solution in the format of the list initial_state of ForestTSPSolver
+        with the same starting node.
+        """
+        if self.solution is None:
+            self.solve_tsp()
+        return tour_to_initial_state(self.solution, self.starting_node)
+
+
+def get_nearest_neighbour_tour(cost_matrix, starting_node=0):
+    """
+    Returns the tour (array of nodes) created by always going to the closest unvisited node.
+    """
+    number_of_nodes = len(cost_matrix)
+    tour = np.empty(number_of_nodes, dtype=np.int64)
+    tour[0] = starting_node
+    visited = np.zeros(number_of_nodes, dtype=bool)
+    visited[starting_node] = True
+    for step in range(1, number_of_nodes):
+        distances = np.where(visited, np.inf, cost_matrix[tour[step - 1]])
+        tour[step] = np.argmin(distances)
+        visited[tour[step]] = True
+    return tour
+
+
+def get_neighbour_lists(cost_matrix, number_of_neighbours=8):
+    """
+    Returns (number_of_nodes, k) array with k = min(number_of_neighbours, number_of_nodes - 1)
+    closest other nodes of every node, sorted by distance.
+    """
+    number_of_nodes = len(cost_matrix)
+    number_of_neighbours = min(number_of_neighbours, number_of_nodes - 1)
+    if number_of_neighbours <= 0:
+        return np.zeros((number_of_nodes, 0), dtype=np.int64)
+    distances = np.array(cost_matrix, dtype=float)
+    np.fill_diagonal(distances, np.inf)
+    if number_of_neighbours < number_of_nodes - 1:
+        neighbours = np.argpartition(distances, number_of_neighbours, axis=1)[:, :number_of_neighbours]
+    else:
+        neighbours = np.tile(np.arange(number_of_nodes), (number_of_nodes, 1))[~np.eye(number_of_nodes, dtype=bool)]
+        neighbours = neighbours.reshape(number_of_nodes, number_of_nodes - 1)
+    order = np.argsort(np.take_along_axis(distances, neighbours, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(neighbours, order, axis=1)
+
+
+def improve_tour(cost_matrix, tour, neighbours, use_or_opt=True, max_segment_length=3):
+    """
+    Improves the tour with 2-opt and Or-opt (moving segments of up to max_segment_length
+    nodes, possibly reversed) until no improving move is found.
+    Only moves creating an edge between a node and one of its neighbours are tried,
+    nodes are processed in a queue of "don't-look bits" (a node is checked again
+    only when one of its edges changes) and every move is evaluated in O(1)
+    from the lengths of the removed and added edges, so cost_matrix has to be symmetric.
+    Returns the improved tour as a new array.
+    """
+    tour = np.array(tour, dtype=np.int64)
+    number_of_nodes = len(tour)
+    if number_of_nodes < 4:
+        return tour
+    positions = np.empty(number_of_nodes, dtype=np.int64)
+    positions[tour] = np.arange(number_of_nodes)
+    distance = cost_matrix.item
+    neighbour_lists = neighbours.tolist()
+    tolerance = 1e-10
+
+    queue = collections.deque(tour.tolist())
+    active = np.ones(number_of_nodes, dtype=bool)
+
+    def succ(node):
+        return tour.item((positions.item(node) + 1) % number_of_nodes)
+
+    def pred(node):
+        return tour.item(positions.item(node) - 1)
+
+    def reverse(first, last):
+        # Reverses the path from node first to node last (going forward),
+        # or the rest of the tour, if it is shorter, which gives the same edges.
+        i, j = positions.item(first), positions.item(last)
+        length = (j - i) % number_of_nodes + 1
+        if 2 * length > number_of_nodes:
+            i, j = (j + 1) % number_of_nodes, (i - 1) % number_of_nodes
+            length = number_of_nodes - length
+        indices = (i + np.arange(length)) % number_of_nodes
+        tour[indices] = tour[indices[::-1]]
+        positions[tour[indices]] = indices
+
+    def move_segment(first, length, previous, reversed_segment):
+        # Moves the segment of given length starting at node first after node previous.
+        rolled = np.roll(tour, -positions.item(first))
+        segment, rest = rolled[:length], rolled[length:]
+        insert_position = (positions.item(previous) - positions.item(first) - length) % number_of_nodes + 1
+        if reversed_segment:
+            segment = segment[::-1]
+        tour[:] = np.concatenate((rest[:insert_position], segment, rest[insert_position:]))
+        positions[tour] = np.arange(number_of_nodes)
+
+    def activate(*nodes):
+        for node in nodes:
+            if not active[node]:
+                active[node] = True
+                queue.append(node)
+
+    def try_2opt(a):
+        for direction in (succ, pred):
+            b = direction(a)
+            d_ab = distance(a, b)
+            for c in neighbour_lists[a]:
+                d_ac = distance(a, c)
+                if d_ac >= d_ab:
+                    break
+                d = direction(c)
+                if c == b or d == a:
+                    continue
+                delta = d_ac + distance(b, d) - d_ab - distance(c, d)
+                if delta < -tolerance:
+                    if direction is succ:
+                        reverse(b, c)
+                    else:
+                        reverse(c, b)
+                    activate(a, b, c, d)
+                    return True
+        return False
+
+    def try_or_opt(first):
+        segment = [first]
+        for length in range(1, max_segment_length + 1):
+            if length > 1:
+                segment.append(succ(segment[-1]))
+            last = segment[-1]
+            a, b = pred(first), succ(last)
+            if b == a or b in segment:
+                break
+            removal_gain = distance(a, first) + distance(last, b) - distance(a, b)
+            for end, other_end in ((first, last), (last, first)):
+                for c in neighbour_lists[end]:
+                    d_end = distance(c, end)
+                    if d_end >= removal_gain:
+                        break
+                    if c in segment:
+                        continue
+                    # c is joined with end; the segment goes on either side of c.
+                    for p, q in ((c, succ(c)), (pred(c), c)):
+                        if p in segment or q in segment:
+                            continue
+                        other = q if p == c else p
+                        delta = d_end + distance(other_end, other) - distance(p, q) - removal_gain
+                        if delta < -tolerance:
+                            # The segment keeps its orientation if first follows p.
+                            reversed_segment = (p == c) != (end == first)
+                            move_segment(first, length, p, reversed_segment)
+                            activate(a, b, p, q, first, last)
+                            return True
+        return False
+
+    while queue:
+        node = queue.popleft()
+        active[node] = False
+        if try_2opt(node) or (use_or_opt and try_or_opt(node)):
+            activate(node)
+    return tour
+
+
+def tour_to_initial_state(tour, starting_node=0):
+    """
+    Transforms a tour of all the nodes into the list initial_state of ForestTSPSolver:
+    the tour is rotated to begin at starting_node, which is then dropped, and the remaining
+    nodes are renumbered as in the reduced problem (inverse of ForestTSPSolver.get_solution_for_full_array).
+    """
+    tour = np.asarray(tour)
+    tour = np.roll(tour, -int(np.flatnonzero(tour == starting_node)[0]))[1:]
+    return [int(node) - 1 if node > starting_node else int(node) for node in tour]
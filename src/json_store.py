@@ -0,0 +1,23 @@
+import json
+import os
+
+
+def load_json(path):
+    """
+    Returns the data read from the JSON file at path, or None if there is no such file.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path) as json_file:
+        return json.load(json_file)
+
+
+def save_json(path, data):
+    """
+    Saves data to the JSON file at path. It is written to a temporary file
+    and renamed, so concurrent runs never read a partial file.
+    """
+    temporary_path = path + ".tmp." + str(os.getpid())
+    with open(temporary_path, "w") as json_file:
+        json.dump(data, json_file)
+    os.replace(temporary_path, path)
@@ -2,6 +2,8 @@ import time
 import TSP_utilities
 from forest_tsp_solver import ForestTSPSolver
 from dwave_tsp_solver import DWaveTSPSolver
+from heuristic_tsp_solver import HeuristicTSPSolver
+from samplers import SimulatedAnnealingSampler
 
 def main():
     nodes_array = TSP_utilities.create_nodes_array(4)
@@ -10,33 +12,48 @@ def main():
     sapi_token = None
     dwave_url = 'https://cloud.dwavesys.com/sapi'
 
-    print("Brute Force solution")
+    print("Exact solution")
     start_time = time.time()
     bf_start_time = start_time
-    brute_force_solution = TSP_utilities.solve_tsp_brute_force_from_given_node(nodes_array, starting_node)
+    brute_force_solution = TSP_utilities.solve_tsp_dynamic_programming(nodes_array, starting_node, cost_matrix=tsp_matrix)
     end_time = time.time()
     calculation_time = end_time - start_time
     print("Calculation time:", calculation_time)
-    TSP_utilities.plot_solution('brute_force_' + str(start_time), nodes_array, brute_force_solution)
+    optimal_cost = TSP_utilities.calculate_cost(tsp_matrix, brute_force_solution)
+    TSP_utilities.plot_solution('brute_force_' + str(start_time), nodes_array, brute_force_solution, cost_matrix=tsp_matrix)
 
-    if sapi_token is None or dwave_url is None:
-        print("You cannot run code on DWave without specifying your sapi_token and url")
-    elif len(nodes_array) >= 10:
+    print("Heuristic solution")
+    start_time = time.time()
+    heuristic_solver = HeuristicTSPSolver(tsp_matrix, starting_node=starting_node)
+    heuristic_solution, _ = heuristic_solver.solve_tsp()
+    end_time = time.time()
+    calculation_time = end_time - start_time
+    print("Calculation time:", calculation_time)
+    print("Heuristic:", heuristic_solution, TSP_utilities.calculate_cost(tsp_matrix, heuristic_solution))
+
+    if len(nodes_array) >= 10:
         print("This problem size is to big to run on D-Wave.")
     else:
+        if sapi_token is None or dwave_url is None:
+            print("sapi_token and url not specified - DWave solver will use local simulated annealing.")
+            dwave_sampler = SimulatedAnnealingSampler()
+        else:
+            dwave_sampler = None
         print("DWave solution")
         start_time = time.time()
-        dwave_solver = DWaveTSPSolver(tsp_matrix, sapi_token=sapi_token, url=dwave_url)
+        dwave_solver = DWaveTSPSolver(tsp_matrix, sapi_token=sapi_token, url=dwave_url, sampler=dwave_sampler)
         dwave_solution, dwave_distribution = dwave_solver.solve_tsp()
         end_time = time.time()
         calculation_time = end_time - start_time
         print("Calculation time:", calculation_time)
-        costs = [(sol, TSP_utilities.calculate_cost(tsp_matrix, sol), dwave_distribution[sol]) for sol in dwave_distribution]
-        solution_cost = TSP_utilities.calculate_cost(tsp_matrix, dwave_solution)
-        print("DWave:", dwave_solution, solution_cost)
-        for cost in costs:
-            print(cost)
-        TSP_utilities.plot_solution('dwave_' + str(bf_start_time), nodes_array, dwave_solution)
+        print("Feasible samples:", dwave_solver.get_feasibility_rate())
+        print_distribution(dwave_distribution, optimal_cost)
+        if dwave_solution is None:
+            print("DWave: no feasible solution found")
+        else:
+            solution_cost = TSP_utilities.calculate_cost(tsp_matrix, dwave_solution)
+            print("DWave:", dwave_solution, solution_cost)
+            TSP_utilities.plot_solution('dwave_' + str(bf_start_time), nodes_array, dwave_solution, cost_matrix=tsp_matrix)
 
 
     print("QAOA solution - Forest")
@@ -46,11 +63,26 @@ def main():
     end_time = time.time()
     calculation_time = end_time - start_time
     print("Calculation time:", calculation_time)
-    costs = [(sol, TSP_utilities.calculate_cost(tsp_matrix, sol), forest_distribution[sol]) for sol in forest_distribution]
     print("Forest:")
-    for cost in costs:
-        print(cost)
-    TSP_utilities.plot_solution('forest_' + str(bf_start_time), nodes_array, forest_solution)
+    print_distribution(forest_distribution, optimal_cost)
+    if forest_solution is None:
+        print("Forest: no feasible solution found")
+    else:
+        TSP_utilities.plot_solution('forest_' + str(bf_start_time), nodes_array, forest_solution, cost_matrix=tsp_matrix)
+
+
+def print_distribution(distribution, optimal_cost, number_of_tours=10):
+    """
+    Prints the cheapest tours of the distribution with their costs, counts and energies,
+    and how close the samples are to the optimal solution.
+    """
+    if len(distribution) == 0:
+        return
+    best_tours = distribution.top_k(number_of_tours)
+    for tour, cost, count, energy in zip(best_tours, best_tours.costs, best_tours.counts, best_tours.energies):
+        print((tour, cost, count, energy))
+    print("Approximation ratio:", distribution.get_approximation_ratio(optimal_cost))
+    print("Ground state probability:", distribution.get_ground_state_probability(optimal_cost))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,150 @@
+import contextlib
+import json
+import os
+import resource
+import time
+import tracemalloc
+
+
+class Profiler(object):
+    """
+    Opt-in instrumentation of the solvers. Solvers wrap their phases
+    (building Hamiltonians, optimization, sampling, decoding...) in
+    profiler.phase(name) and report numbers of events with profiler.count(name).
+    Every phase becomes a record with its start (in seconds since the creation
+    of the profiler), duration, nesting depth and the process peak RSS at its end.
+    With trace_memory=True phases also get the peak of memory allocated by Python
+    and NumPy during the phase (measured with tracemalloc, which slows things down).
+    A disabled profiler records nothing, so solvers can always call it.
+    """
+    def __init__(self, enabled=True, trace_memory=False):
+        self.enabled = enabled
+        self.trace_memory = trace_memory
+        self.records = []
+        self.counts = {}
+        self.start_time = time.perf_counter()
+        self._stack = []
+        self._started_tracing = False
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            self._update_peak_of_current_phase()
+        entry = {"name": name, "depth": len(self._stack), "peak_allocated": 0}
+        self._stack.append(entry)
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            end_time = time.perf_counter()
+            self._stack.pop()
+            record = {"name": name,
+                      "start": start_time - self.start_time,
+                      "duration": end_time - start_time,
+                      "depth": entry["depth"],
+                      "peak_rss_mb": get_peak_rss_mb()}
+            if self.trace_memory:
+                entry["peak_allocated"] = max(entry["peak_allocated"], tracemalloc.get_traced_memory()[1])
+                tracemalloc.reset_peak()
+                if self._stack:
+                    self._stack[-1]["peak_allocated"] = max(self._stack[-1]["peak_allocated"], entry["peak_allocated"])
+                elif self._started_tracing:
+                    tracemalloc.stop()
+                    self._started_tracing = False
+                record["peak_allocated_mb"] = entry["peak_allocated"] / 2**20
+            self.records.append(record)
+
+    def _update_peak_of_current_phase(self):
+        # tracemalloc has a single peak, which is reset at the start of every phase,
+        # so the peak reached so far is saved in the enclosing phase first.
+        if self._stack and tracemalloc.is_tracing():
+            self._stack[-1]["peak_allocated"] = max(self._stack[-1]["peak_allocated"], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+
+    def count(self, name, number=1):
+        if self.enabled:
+            self.counts[name] = self.counts.get(name, 0) + number
+
+    def count_calls(self, function, name):
+        """
+        Returns function, which counts its calls under given name.
+        """
+        def counted_function(*args, **kwargs):
+            self.count(name)
+            return function(*args, **kwargs)
+        return counted_function
+
+    def summary(self):
+        """
+        Returns a dictionary name -> {"calls", "total_time", "max_time", "peak_rss_mb"
+        and, with trace_memory, "peak_allocated_mb"} aggregated over all records
+        of every phase, and the counts under the key "counts".
+        """
+        summary = {}
+        for record in self.records:
+            phase_summary = summary.setdefault(record["name"], {"calls": 0, "total_time": 0.0, "max_time": 0.0, "peak_rss_mb": 0.0})
+            phase_summary["calls"] += 1
+            phase_summary["total_time"] += record["duration"]
+            phase_summary["max_time"] = max(phase_summary["max_time"], record["duration"])
+            phase_summary["peak_rss_mb"] = max(phase_summary["peak_rss_mb"], record["peak_rss_mb"])
+            if "peak_allocated_mb" in record:
+                phase_summary["peak_allocated_mb"] = max(phase_summary.get("peak_allocated_mb", 0.0), record["peak_allocated_mb"])
+        summary["counts"] = dict(self.counts)
+        return summary
+
+    def to_chrome_trace(self):
+        """
+        Returns the records in the Chrome trace event format, which can be opened
+        in chrome://tracing or Perfetto. Phases are complete ("X") events and
+        counts are one counter ("C") event at the end of the trace.
+        """
+        process_id = os.getpid()
+        events = []
+        for record in self.records:
+            args = {key: value for key, value in record.items() if key.endswith("_mb")}
+            events.append({"name": record["name"], "cat": "phase", "ph": "X", "pid": process_id, "tid": 0,
+                           "ts": record["start"] * 1e6, "dur": record["duration"] * 1e6, "args": args})
+        if self.counts:
+            end = max([record["start"] + record["duration"] for record in self.records], default=0.0)
+            events.append({"name": "counts", "ph": "C", "pid": process_id, "tid": 0,
+                           "ts": end * 1e6, "args": dict(self.counts)})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def save_chrome_trace(self, path):
+        with open(path, "w") as trace_file:
+            json.dump(self.to_chrome_trace(), trace_file)
+
+    def save_records(self, path):
+        """
+        Saves the records and counts as JSON.
+        """
+        with open(path, "w") as records_file:
+            json.dump({"records": self.records, "counts": self.counts}, records_file, indent=2)
+
+
+def get_peak_rss_mb():
+    """
+    Returns the peak resident set size of this process in MB (Linux reports kB).
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def counting_minimizer(profiler, minimizer):
+    """
+    Wraps a scipy.optimize.minimize-like minimizer, so that the profiler counts
+    evaluations of the objective ("objective_evaluations") and iterations
+    ("optimizer_iterations", counted with the callback).
+    """
+    def minimize(fun, x0, *args, callback=None, **kwargs):
+        def counting_callback(*callback_args):
+            profiler.count("optimizer_iterations")
+            if callback is not None:
+                return callback(*callback_args)
+        return minimizer(profiler.count_calls(fun, "objective_evaluations"), x0, *args, callback=counting_callback, **kwargs)
+    return minimize
@@ -0,0 +1,293 @@
+import concurrent.futures
+import functools
+import itertools
+import math
+import time
+import numpy as np
+import scipy.optimize
+import scipy.sparse
+import scipy.sparse.csgraph
+import scipy.sparse.linalg
+
+
+class StatevectorQAOA(object):
+    """
+    In-process replacement for grove's QAOA, which keeps the full statevector in NumPy.
+    The phase separator is diagonal, so it is stored as a vector of energies
+    of all the basis states. Every mixer operator is a sparse Hermitian matrix
+    and their exponentials are applied in the same order as in grove.
+    Mixers, which split into small independent blocks (as the Hadfield mixers do),
+    are diagonalized once, so applying them costs two sparse products;
+    others are applied with scipy.sparse.linalg.expm_multiply. Precomputed
+    mixer_eigensystems can be passed to skip the diagonalization.
+    Qubit i corresponds to bit i of the basis state index, as in pyquil wavefunctions.
+    If the dynamics never leaves some subspace (e.g. permutations for the Hadfield mixer),
+    vectors and matrices can be restricted to it; basis_states then holds the sorted
+    indices of the basis states, which span this subspace.
+    It implements get_angles and get_string with the same signatures and return
+    values as grove.pyqaoa.qaoa.QAOA, so solvers can use either of them.
+    With use_gradient=True the minimizer gets the objective together with its
+    exact gradient, calculated with the adjoint method (minimizer_kwargs should
+    then contain 'jac': True and a gradient-based method).
+    """
+    def __init__(self, cost_vector, mixer_matrices, initial_state_vector, steps=1,
+                 minimizer=scipy.optimize.minimize, minimizer_kwargs=None, rand_seed=None,
+                 number_of_qubits=None, basis_states=None, use_gradient=False, mixer_eigensystems=None):
+        self.cost_vector = np.asarray(cost_vector, dtype=float)
+        self.mixer_matrices = [scipy.sparse.csr_matrix(matrix) for matrix in mixer_matrices]
+        if mixer_eigensystems is None:
+            mixer_eigensystems = [diagonalize_in_blocks(matrix) for matrix in self.mixer_matrices]
+        self.mixer_eigensystems = mixer_eigensystems
+        initial_state_vector = np.asarray(initial_state_vector, dtype=complex)
+        self.initial_state_vector = initial_state_vector / np.linalg.norm(initial_state_vector)
+        if number_of_qubits is None:
+            number_of_qubits = int(np.log2(len(self.cost_vector)))
+        self.number_of_qubits = number_of_qubits
+        if basis_states is None:
+            basis_states = np.arange(len(self.cost_vector))
+        self.basis_states = np.asarray(basis_states)
+        self.steps = steps
+        self.minimizer = minimizer
+        self.use_gradient = use_gradient
+        if minimizer_kwargs is None and use_gradient:
+            minimizer_kwargs = {'method': 'BFGS', 'jac': True}
+        elif minimizer_kwargs is None:
+            minimizer_kwargs = {'method': 'Nelder-Mead'}
+        self.minimizer_kwargs = minimizer_kwargs
+        self.random_generator = np.random.RandomState(rand_seed)
+        self.reports = []
+
+    def get_wavefunction(self, betas, gammas):
+        """
+        Returns the state after applying all the QAOA steps to the initial state.
+        """
+        state = self.initial_state_vector
+        for beta, gamma in zip(betas, gammas):
+            state = np.exp(-1j * gamma * self.cost_vector) * state
+            for mixer_index in range(len(self.mixer_matrices)):
+                state = self.apply_mixer(mixer_index, beta, state)
+        return state
+
+    def apply_mixer(self, mixer_index, beta, states):
+        """
+        Returns exp(-i beta M) states, where M is the mixer with given index.
+        states can be a single vector or vectors stacked as columns.
+        """
+        eigensystem = self.mixer_eigensystems[mixer_index]
+        if eigensystem is None:
+            return scipy.sparse.linalg.expm_multiply(-1j * beta * self.mixer_matrices[mixer_index], states)
+        eigenvalues, eigenvectors, eigenvectors_adjoint = eigensystem
+        phases = np.exp(-1j * beta * eigenvalues)
+        if states.ndim > 1:
+            phases = phases[:, np.newaxis]
+        return eigenvectors @ (phases * (eigenvectors_adjoint @ states))
+
+    def get_probabilities(self, betas, gammas):
+        return np.abs(self.get_wavefunction(betas, gammas))**2
+
+    def expectation(self, betas, gammas):
+        """
+        Returns the expectation value of the phase separator for given angles.
+        """
+        return np.dot(self.get_probabilities(betas, gammas), self.cost_vector)
+
+    def expectation_and_gradient(self, betas, gammas):
+        """
+        Returns the expectation value of the phase separator and its derivatives
+        with respect to betas and gammas. The gradient is calculated with the adjoint
+        method: the final state is propagated backwards together with the cost operator
+        applied to it, which costs about three times as much as a single expectation.
+        """
+        state = self.get_wavefunction(betas, gammas)
+        adjoint_state = self.cost_vector * state
+        value = np.real(np.vdot(state, adjoint_state))
+        beta_gradient = np.zeros(len(betas))
+        gamma_gradient = np.zeros(len(gammas))
+        for step in reversed(range(len(betas))):
+            for mixer_index in reversed(range(len(self.mixer_matrices))):
+                mixer_matrix = self.mixer_matrices[mixer_index]
+                beta_gradient[step] += 2 * np.imag(np.vdot(adjoint_state, mixer_matrix @ state))
+                states = self.apply_mixer(mixer_index, -betas[step], np.column_stack((state, adjoint_state)))
+                state, adjoint_state = states[:, 0], states[:, 1]
+            gamma_gradient[step] += 2 * np.imag(np.vdot(adjoint_state, self.cost_vector * state))
+            phases = np.exp(1j * gammas[step] * self.cost_vector)
+            state = phases * state
+            adjoint_state = phases * adjoint_state
+        return value, beta_gradient, gamma_gradient
+
+    def get_random_angles(self, steps=None):
+        """
+        Returns random betas from [0, pi) and gammas from [0, 2 pi), as grove does.
+        """
+        if steps is None:
+            steps = self.steps
+        betas = self.random_generator.uniform(0, np.pi, steps)
+        gammas = self.random_generator.uniform(0, 2 * np.pi, steps)
+        return betas, gammas
+
+    def get_angles(self, init_betas=None, init_gammas=None):
+        """
+        Finds the optimal angles with the classical minimizer, starting from
+        given angles or, by default, from random ones. Returns (betas, gammas);
+        the report of the optimization is appended to self.reports.
+        """
+        if init_betas is None or init_gammas is None:
+            init_betas, init_gammas = self.get_random_angles()
+        betas, gammas, report = self.optimize_angles(init_betas, init_gammas)
+        self.reports.append(report)
+        return betas, gammas
+
+    def optimize_angles(self, init_betas, init_gammas):
+        """
+        Minimizes the expectation value starting from given angles.
+        Returns (betas, gammas, report). The report is a dictionary with the initial
+        and final angles, the final value, numbers of function evaluations and iterations,
+        durations of consecutive iterations and the total time in seconds.
+        """
+        steps = len(init_betas)
+        report = {'initial_betas': list(init_betas), 'initial_gammas': list(init_gammas),
+                  'function_evaluations': 0, 'iteration_times': []}
+        start_time = time.time()
+        last_iteration_time = [start_time]
+
+        def objective(params):
+            report['function_evaluations'] += 1
+            if self.use_gradient:
+                value, beta_gradient, gamma_gradient = self.expectation_and_gradient(params[:steps], params[steps:])
+                return value, np.hstack((beta_gradient, gamma_gradient))
+            return self.expectation(params[:steps], params[steps:])
+
+        def callback(*args):
+            current_time = time.time()
+            report['iteration_times'].append(current_time - last_iteration_time[0])
+            last_iteration_time[0] = current_time
+
+        result = self.minimizer(objective, np.hstack((init_betas, init_gammas)), callback=callback, **self.minimizer_kwargs)
+        betas, gammas = result.x[:steps], result.x[steps:]
+        report['betas'] = betas.tolist()
+        report['gammas'] = gammas.tolist()
+        report['value'] = float(np.real(result.fun))
+        report['iterations'] = len(report['iteration_times'])
+        report['time'] = time.time() - start_time
+        return betas, gammas, report
+
+    def get_string(self, betas, gammas, samples=100):
+        """
+        Samples the final state. Returns the most frequent bitstring and a dictionary
+        bitstring -> number of occurrences; bitstrings are tuples with one bit per qubit.
+        """
+        probabilities = self.get_probabilities(betas, gammas)
+        probabilities /= probabilities.sum()
+        sampled_states = self.random_generator.choice(len(probabilities), size=samples, p=probabilities)
+        states, counts = np.unique(sampled_states, return_counts=True)
+        states = self.basis_states[states]
+        bits = (states[:, np.newaxis] >> np.arange(self.number_of_qubits)) & 1
+        sampling_results = {tuple(state_bits): count for state_bits, count in zip(bits.tolist(), counts.tolist())}
+        most_frequent_string = tuple(bits[np.argmax(counts)].tolist())
+        return most_frequent_string, sampling_results
+
+
+def get_angles_multistart(qaoa, number_of_starts, num_workers=1):
+    """
+    Optimizes angles of given StatevectorQAOA from number_of_starts random starting points.
+    With num_workers > 1 the optimizations run concurrently in a process pool.
+    Returns (betas, gammas, reports) of the best optimization and reports of all of them.
+    """
+    starting_angles = [qaoa.get_random_angles() for _ in range(number_of_starts)]
+    if num_workers == 1:
+        results = [qaoa.optimize_angles(betas, gammas) for betas, gammas in starting_angles]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=num_workers) as executor:
+            futures = [executor.submit(qaoa.optimize_angles, betas, gammas) for betas, gammas in starting_angles]
+            results = [future.result() for future in futures]
+    reports = [report for _, _, report in results]
+    qaoa.reports.extend(reports)
+    best_betas, best_gammas, _ = min(results, key=lambda result: result[2]['value'])
+    return best_betas, best_gammas, reports
+
+
+def interpolate_angles(betas, gammas):
+    """
+    Creates angles for p + 1 layers out of the optimal angles for p layers
+    by linear interpolation (INTERP strategy from https://arxiv.org/abs/1812.01041).
+    """
+    def interpolate(angles):
+        padded_angles = np.concatenate(([0], angles, [0]))
+        steps = len(angles)
+        layers = np.arange(1, steps + 2)
+        return (layers - 1) / steps * padded_angles[:-1] + (steps - layers + 1) / steps * padded_angles[1:]
+
+    return interpolate(np.asarray(betas, dtype=float)), interpolate(np.asarray(gammas, dtype=float))
+
+
+def diagonalize_in_blocks(matrix, max_block_size=64):
+    """
+    Diagonalizes a sparse Hermitian matrix, which is a direct sum of small blocks,
+    i.e. connected components of its nonzero pattern. Blocks of equal size are
+    diagonalized together with a single batched numpy.linalg.eigh call.
+    Returns (eigenvalues, eigenvectors, eigenvectors_adjoint) with eigenvectors
+    as a sparse unitary matrix, or None if any block is bigger than max_block_size.
+    """
+    matrix = scipy.sparse.coo_matrix(matrix)
+    dimension = matrix.shape[0]
+    _, labels = scipy.sparse.csgraph.connected_components(abs(matrix), directed=False)
+    block_sizes = np.bincount(labels)
+    if block_sizes.max() > max_block_size:
+        return None
+
+    # Position of every basis state inside of its block.
+    order = np.argsort(labels, kind='stable')
+    block_starts = np.concatenate(([0], np.cumsum(block_sizes)[:-1]))
+    positions = np.empty(dimension, dtype=np.int64)
+    positions[order] = np.arange(dimension) - block_starts[labels[order]]
+
+    eigenvalues = np.zeros(dimension)
+    rows, cols, values = [], [], []
+    for block_size in np.unique(block_sizes):
+        blocks = np.flatnonzero(block_sizes == block_size)
+        # Index of every block among the blocks of this size.
+        block_numbers = np.full(len(block_sizes), -1)
+        block_numbers[blocks] = np.arange(len(blocks))
+
+        block_matrices = np.zeros((len(blocks), block_size, block_size), dtype=complex)
+        in_blocks = block_numbers[labels[matrix.row]] >= 0
+        np.add.at(block_matrices,
+                  (block_numbers[labels[matrix.row[in_blocks]]], positions[matrix.row[in_blocks]], positions[matrix.col[in_blocks]]),
+                  matrix.data[in_blocks])
+        block_eigenvalues, block_eigenvectors = np.linalg.eigh(block_matrices)
+
+        states = np.empty((len(blocks), block_size), dtype=np.int64)
+        states_of_size = np.flatnonzero(block_numbers[labels] >= 0)
+        states[block_numbers[labels[states_of_size]], positions[states_of_size]] = states_of_size
+        # Eigenvectors of a block are stored in the columns belonging to its states.
+        eigenvalues[states] = block_eigenvalues
+        rows.append(np.repeat(states, block_size, axis=1).ravel())
+        cols.append(np.tile(states, (1, block_size)).ravel())
+        values.append(block_eigenvectors.ravel())
+
+    eigenvectors = scipy.sparse.coo_matrix((np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))),
+                                           shape=(dimension, dimension)).tocsr()
+    return eigenvalues, eigenvectors, eigenvectors.conj().T.tocsr()
+
+
+@functools.lru_cache(maxsize=None)
+def get_permutation_basis_states(number_of_nodes):
+    """
+    Returns sorted indices of the basis states, in which qubit t * number_of_nodes + i
+    is 1 when node i is visited at time t, and which encode valid permutations,
+    together with the (number_of_nodes!, number_of_nodes) array of these permutations.
+    Results are cached and returned as read-only arrays.
+    Indices are packed into int64, so at most 64 qubits (8 nodes) are supported.
+    """
+    if number_of_nodes**2 > 64:
+        raise ValueError("Basis states of " + str(number_of_nodes**2) + " qubits do not fit into int64 (at most 8 nodes).")
+    permutations = np.fromiter(itertools.chain.from_iterable(itertools.permutations(range(number_of_nodes))),
+                               dtype=np.int64)
+    permutations = permutations.reshape(math.factorial(number_of_nodes), number_of_nodes)
+    qubits = np.arange(number_of_nodes) * number_of_nodes + permutations
+    basis_states = (np.int64(1) << qubits).sum(axis=1)
+    order = np.argsort(basis_states)
+    basis_states, permutations = basis_states[order], permutations[order]
+    basis_states.setflags(write=False)
+    permutations.setflags(write=False)
+    return basis_states, permutations
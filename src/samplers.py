@@ -0,0 +1,113 @@
+import concurrent.futures
+import numpy as np
+
+
+class SimulatedAnnealingSampler(object):
+    """
+    Classical sampler, which can be used instead of the D-Wave QPU.
+    Each read is one replica of simulated annealing. Replicas are stored
+    as rows of a binary matrix and updated together, one variable at a time,
+    so a whole batch of reads costs the same number of NumPy calls as one read.
+    Batches can be spread across a process pool with num_workers; by default
+    reads are split evenly between the workers.
+    It has dimod's parameters and properties attributes, so it can be wrapped
+    in dimod and dwave.system composites (e.g. dimod.StructureComposite, to act
+    as a sampler with the hardware graph).
+    """
+    def __init__(self, num_sweeps=1000, batch_size=None, num_workers=1):
+        self.num_sweeps = num_sweeps
+        self.batch_size = batch_size
+        self.num_workers = num_workers
+        self.parameters = {'num_reads': [], 'num_sweeps': [], 'beta_range': [], 'seed': []}
+        self.properties = {}
+
+    def sample(self, bqm, num_reads=1000, num_sweeps=None, beta_range=None, seed=None, **kwargs):
+        """
+        Samples given dimod.BinaryQuadraticModel and returns a dimod.SampleSet
+        sorted by energy. Other keyword arguments (e.g. chain_strength) are
+        ignored, so it can be used in place of the D-Wave samplers.
+        """
+        import dimod
+        if num_sweeps is None:
+            num_sweeps = self.num_sweeps
+        binary_bqm = bqm.change_vartype(dimod.BINARY, inplace=False)
+        variables = list(binary_bqm.variables)
+        linear, couplings, offset = get_dense_qubo(binary_bqm, variables)
+        if beta_range is None:
+            beta_range = get_default_beta_range(linear, couplings)
+        betas = np.geomspace(beta_range[0], beta_range[1], num_sweeps)
+
+        batch_size = self.batch_size
+        if batch_size is None:
+            batch_size = max(-(-num_reads // self.num_workers), 1)
+        batch_sizes = [min(batch_size, num_reads - start) for start in range(0, num_reads, batch_size)]
+        seeds = np.random.SeedSequence(seed).spawn(len(batch_sizes))
+        if self.num_workers == 1 or len(batch_sizes) == 1:
+            batches = [anneal(linear, couplings, betas, size, batch_seed) for size, batch_seed in zip(batch_sizes, seeds)]
+        else:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=self.num_workers) as executor:
+                futures = [executor.submit(anneal, linear, couplings, betas, size, batch_seed) for size, batch_seed in zip(batch_sizes, seeds)]
+                batches = [future.result() for future in futures]
+
+        samples = np.concatenate(batches) if batches else np.zeros((0, len(variables)), dtype=np.int8)
+        energies = calculate_energies(samples, linear, couplings) + offset
+        order = np.argsort(energies, kind='stable')
+        sampleset = dimod.SampleSet.from_samples((samples[order], variables), dimod.BINARY, energies[order])
+        return sampleset.change_vartype(bqm.vartype, inplace=False)
+
+
+def get_dense_qubo(bqm, variables):
+    """
+    Returns linear biases, symmetric coupling matrix with zero diagonal and offset
+    of a binary quadratic model, so that its energy is x.h + x.J.x / 2 + offset.
+    """
+    linear, (rows, cols, values), offset = bqm.to_numpy_vectors(variable_order=variables)
+    couplings = np.zeros((len(variables), len(variables)))
+    np.add.at(couplings, (rows, cols), values)
+    np.add.at(couplings, (cols, rows), values)
+    return np.asarray(linear, dtype=float), couplings, offset
+
+
+def get_default_beta_range(linear, couplings):
+    """
+    Chooses inverse temperatures, so that at the beginning the largest energy
+    change is accepted with probability 1/2 and at the end the smallest
+    one with probability 1/100.
+    """
+    biases = np.abs(np.concatenate([linear, couplings.ravel()]))
+    biases = biases[biases > 0]
+    if len(biases) == 0:
+        return 0.1, 1.0
+    max_delta = np.max(np.abs(linear) + np.abs(couplings).sum(axis=1))
+    return np.log(2) / max_delta, np.log(100) / np.min(biases)
+
+
+def anneal(linear, couplings, betas, number_of_replicas, seed=None):
+    """
+    Runs simulated annealing for number_of_replicas replicas at once.
+    Each beta from betas is one Metropolis sweep over all the variables.
+    Returns (number_of_replicas, number_of_variables) array of samples.
+    """
+    random_generator = np.random.default_rng(seed)
+    number_of_variables = len(linear)
+    states = random_generator.integers(0, 2, size=(number_of_replicas, number_of_variables), dtype=np.int8)
+    # fields[r, k] is the energy change of setting variable k of replica r from 0 to 1.
+    fields = linear + states @ couplings
+    for beta in betas:
+        thresholds = random_generator.random((number_of_variables, number_of_replicas))
+        for variable in range(number_of_variables):
+            signs = 1 - 2 * states[:, variable]
+            energy_changes = signs * fields[:, variable]
+            accepted = np.exp(-beta * np.maximum(energy_changes, 0)) > thresholds[variable]
+            if accepted.any():
+                states[accepted, variable] ^= 1
+                fields[accepted] += signs[accepted, np.newaxis] * couplings[variable]
+    return states
+
+
+def calculate_energies(samples, linear, couplings):
+    """
+    Calculates energies of binary samples for given linear biases and symmetric couplings.
+    """
+    samples = samples.astype(float)
+    return samples @ linear + 0.5 * np.einsum('ri,ij,rj->r', samples, couplings, samples)
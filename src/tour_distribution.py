@@ -0,0 +1,152 @@
+import numpy as np
+
+import TSP_utilities
+
+
+class TourDistribution(object):
+    """
+    Distribution of sampled tours stored in NumPy arrays instead of a dictionary.
+    Row k of tours (an int16 (number of unique tours, number of nodes) matrix) was
+    sampled counts[k] times and has the lowest energy energies[k] found for it
+    (NaN if the sampler gives no energies). Samples, which did not encode a tour,
+    are only counted in number_of_infeasible_samples.
+    Costs of the tours are calculated on first use, if cost_matrix is given.
+    Batches of samples can be merged in with add, so the per-sample data never
+    has to be kept. Iterating gives the tours as tuples and indexing with a tour
+    gives its count, like the dictionaries returned before.
+    """
+    def __init__(self, tours=None, counts=None, energies=None, number_of_nodes=None,
+                 cost_matrix=None, number_of_infeasible_samples=0):
+        if number_of_nodes is None:
+            number_of_nodes = len(cost_matrix) if cost_matrix is not None else np.shape(tours)[1]
+        self.number_of_nodes = number_of_nodes
+        self.cost_matrix = cost_matrix
+        self.tours = np.zeros((0, number_of_nodes), dtype=np.int16)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.energies = np.zeros(0)
+        self.number_of_infeasible_samples = number_of_infeasible_samples
+        self._costs = None
+        self._index = None
+        if tours is not None:
+            self.add(tours, counts, energies)
+
+    def add(self, tours, counts=None, energies=None, number_of_infeasible_samples=0):
+        """
+        Merges tours (one per row) sampled counts times (1 by default) into the distribution.
+        Counts of repeated tours are summed and the lowest energy is kept.
+        """
+        tours = np.asarray(tours, dtype=np.int16).reshape(-1, self.number_of_nodes)
+        if counts is None:
+            counts = np.ones(len(tours), dtype=np.int64)
+        if energies is None:
+            energies = np.full(len(tours), np.nan)
+        self.number_of_infeasible_samples += number_of_infeasible_samples
+        if len(tours) == 0:
+            return self
+
+        all_tours = np.concatenate((self.tours, tours))
+        all_counts = np.concatenate((self.counts, np.asarray(counts, dtype=np.int64)))
+        all_energies = np.concatenate((self.energies, np.asarray(energies, dtype=float)))
+        unique_tours, indices = np.unique(all_tours, axis=0, return_inverse=True)
+        indices = indices.ravel()
+        self.counts = np.bincount(indices, weights=all_counts, minlength=len(unique_tours)).astype(np.int64)
+        # fmin ignores NaN, so tours without energies do not hide the ones with them.
+        self.energies = np.full(len(unique_tours), np.nan)
+        np.fmin.at(self.energies, indices, all_energies)
+        self.tours = unique_tours
+        self._costs = None
+        self._index = None
+        return self
+
+    def merge(self, other):
+        """
+        Merges another distribution (e.g. from the next batch of samples) into this one.
+        """
+        return self.add(other.tours, other.counts, other.energies, other.number_of_infeasible_samples)
+
+    @property
+    def costs(self):
+        if self._costs is None:
+            if self.cost_matrix is None:
+                raise ValueError("Costs require cost_matrix.")
+            self._costs = TSP_utilities.calculate_costs(self.cost_matrix, self.tours)
+        return self._costs
+
+    def __len__(self):
+        return len(self.tours)
+
+    def __iter__(self):
+        return iter(map(tuple, self.tours.tolist()))
+
+    def __contains__(self, tour):
+        return tuple(tour) in self.get_index()
+
+    def __getitem__(self, tour):
+        return int(self.counts[self.get_index()[tuple(tour)]])
+
+    def get_index(self):
+        # Dictionary tour -> row, built only for lookups of single tours.
+        if self._index is None:
+            self._index = {tour: row for row, tour in enumerate(self)}
+        return self._index
+
+    def to_dict(self):
+        return dict(zip(self, self.counts.tolist()))
+
+    def get_number_of_samples(self):
+        return int(self.counts.sum()) + self.number_of_infeasible_samples
+
+    def get_feasibility_rate(self):
+        number_of_samples = self.get_number_of_samples()
+        if number_of_samples == 0:
+            return 0.0
+        return self.counts.sum() / number_of_samples
+
+    def get_most_frequent_tour(self):
+        if len(self) == 0:
+            return None
+        return self.tours[np.argmax(self.counts)].tolist()
+
+    def get_lowest_energy_tour(self):
+        if len(self) == 0 or np.all(np.isnan(self.energies)):
+            return None
+        return self.tours[np.nanargmin(self.energies)].tolist()
+
+    def top_k(self, k, by="cost"):
+        """
+        Returns the distribution of the k best tours, sorted by "cost" or "energy"
+        (ascending) or "count" (descending).
+        """
+        if by == "cost":
+            keys = self.costs
+        elif by == "energy":
+            keys = self.energies
+        elif by == "count":
+            keys = -self.counts
+        else:
+            raise ValueError("Unknown key: " + str(by))
+        rows = np.argsort(keys, kind='stable')[:k]
+        top = TourDistribution(number_of_nodes=self.number_of_nodes, cost_matrix=self.cost_matrix)
+        top.tours, top.counts, top.energies = self.tours[rows], self.counts[rows], self.energies[rows]
+        if self._costs is not None:
+            top._costs = self._costs[rows]
+        return top
+
+    def get_approximation_ratio(self, optimal_cost):
+        """
+        Returns the expected cost of a feasible sample divided by optimal_cost
+        (NaN if there are no feasible samples).
+        """
+        if len(self) == 0:
+            return np.nan
+        return np.dot(self.counts, self.costs) / self.counts.sum() / optimal_cost
+
+    def get_ground_state_probability(self, optimal_cost, tolerance=1e-9):
+        """
+        Returns the fraction of all the samples (infeasible included), which are optimal tours.
+        """
+        number_of_samples = self.get_number_of_samples()
+        if number_of_samples == 0:
+            return 0.0
+        optimal = self.costs <= optimal_cost * (1 + tolerance)
+        return self.counts[optimal].sum() / number_of_samples
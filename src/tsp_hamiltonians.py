@@ -0,0 +1,205 @@
+import functools
+import numpy as np
+import scipy.sparse
+
+from qaoa_simulator import diagonalize_in_blocks, get_permutation_basis_states
+
+
+class PauliOperatorArrays(object):
+    """
+    Compact representation of a list of Pauli operators (sums of Pauli strings).
+    Term k acts with operators[k, j] ("X", "Y", "Z" or "I" for padding)
+    on qubits[k, j], has coefficient coefficients[k] and belongs to the operator
+    with index groups[k]. pyquil PauliSums are created only on demand.
+    """
+    def __init__(self, qubits, operators, coefficients, groups, number_of_groups):
+        self.qubits = np.asarray(qubits, dtype=np.int64)
+        self.operators = np.asarray(operators)
+        self.coefficients = np.asarray(coefficients)
+        self.groups = np.asarray(groups, dtype=np.int64)
+        self.number_of_groups = number_of_groups
+        self._pauli_sums = None
+
+    def reweighted(self, coefficients):
+        """
+        Returns operators with the same structure and new coefficients.
+        """
+        return PauliOperatorArrays(self.qubits, self.operators, coefficients, self.groups, self.number_of_groups)
+
+    def to_pauli_sums(self):
+        """
+        Returns the operators as a list of pyquil PauliSums.
+        """
+        if self._pauli_sums is None:
+            from pyquil.paulis import PauliTerm, PauliSum
+            terms = [[] for _ in range(self.number_of_groups)]
+            for qubits, operators, coefficient, group in zip(self.qubits.tolist(), self.operators.tolist(),
+                                                              self.coefficients.tolist(), self.groups.tolist()):
+                operations = [(operator, qubit) for operator, qubit in zip(operators, qubits) if operator != "I"]
+                if operations:
+                    terms[group].append(PauliTerm.from_list(operations, coefficient))
+                else:
+                    terms[group].append(PauliTerm("I", 0, coefficient))
+            self._pauli_sums = [PauliSum(group_terms) for group_terms in terms]
+        return list(self._pauli_sums)
+
+    def to_diagonal(self, basis_states):
+        """
+        Returns the sum of all the operators (which have to be diagonal)
+        evaluated on given basis states.
+        """
+        if np.any(np.isin(self.operators, ["X", "Y"])):
+            raise ValueError("Operators are not diagonal.")
+        basis_states = np.asarray(basis_states, dtype=np.int64)
+        diagonal = np.zeros(len(basis_states))
+        # Terms are processed in chunks to bound the size of the array of signs.
+        for start in range(0, len(self.coefficients), 256):
+            terms = np.arange(start, min(start + 256, len(self.coefficients)))
+            diagonal += np.real(self.coefficients[terms]) @ self.get_signs(basis_states, terms)
+        return diagonal
+
+    def get_signs(self, basis_states, terms):
+        """
+        Returns (len(terms), len(basis_states)) array with (-1)^(number of ones
+        on qubits, on which the term acts with Y or Z) for every basis state.
+        """
+        with_sign = np.isin(self.operators[terms], ["Y", "Z"])
+        bits = (basis_states[np.newaxis, np.newaxis, :] >> np.maximum(self.qubits[terms], 0)[:, :, np.newaxis]) & 1
+        parities = (bits * with_sign[:, :, np.newaxis]).sum(axis=1) % 2
+        return 1 - 2 * parities
+
+    def to_sparse_matrices(self, basis_states):
+        """
+        Returns every operator as a sparse matrix acting on the span of given
+        sorted basis states. Parts of single Pauli strings going outside of this span
+        have to cancel out (as they do for the mixers on the permutation subspace)
+        and are dropped.
+        """
+        basis_states = np.asarray(basis_states, dtype=np.int64)
+        indices = np.arange(len(basis_states))
+        is_flip = np.isin(self.operators, ["X", "Y"])
+        flip_masks = (is_flip * (np.int64(1) << np.maximum(self.qubits, 0))).sum(axis=1)
+        number_of_ys = (self.operators == "Y").sum(axis=1)
+        term_coefficients = self.coefficients * 1j**number_of_ys
+
+        order = np.argsort(self.groups, kind='stable')
+        group_starts = np.searchsorted(self.groups[order], np.arange(self.number_of_groups + 1))
+        shape = (len(basis_states), len(basis_states))
+        matrices = []
+        for group in range(self.number_of_groups):
+            terms = order[group_starts[group]:group_starts[group + 1]]
+            values = term_coefficients[terms, np.newaxis] * self.get_signs(basis_states, terms)
+            target_states = basis_states[np.newaxis, :] ^ flip_masks[terms, np.newaxis]
+            target_indices = np.minimum(np.searchsorted(basis_states, target_states), len(basis_states) - 1)
+            inside = basis_states[target_indices] == target_states
+            cols = np.broadcast_to(indices, target_states.shape)
+            matrix = scipy.sparse.coo_matrix((values[inside], (target_indices[inside], cols[inside])), shape=shape).tocsr()
+            matrix.eliminate_zeros()
+            matrices.append(matrix)
+        return matrices
+
+
+@functools.lru_cache(maxsize=None)
+def get_phase_separator_structure(number_of_nodes, starting_node):
+    """
+    Returns the structure of the phase separator for given number of nodes
+    and starting node: PauliOperatorArrays with unit coefficients and arrays
+    (rows, cols, signs), so that the coefficient of term k is
+    signs[k] * distance_matrix[rows[k], cols[k]].
+    """
+    reduced_number_of_nodes = number_of_nodes - 1
+    number_of_qubits = reduced_number_of_nodes**2
+    # Node of the full problem for every city of the reduced one.
+    nodes = np.delete(np.arange(number_of_nodes), starting_node)
+
+    t, city_1, city_2 = np.meshgrid(np.arange(reduced_number_of_nodes - 1), np.arange(reduced_number_of_nodes),
+                                    np.arange(reduced_number_of_nodes), indexing='ij')
+    different = city_1 != city_2
+    t, city_1, city_2 = t[different], city_1[different], city_2[different]
+    pair_qubits = np.column_stack((t * reduced_number_of_nodes + city_1, (t + 1) * reduced_number_of_nodes + city_2))
+
+    # Distances between the starting node and the first and the last city.
+    cities = np.arange(reduced_number_of_nodes)
+    first_qubits = cities
+    last_qubits = number_of_qubits - reduced_number_of_nodes + cities
+    single_qubits = np.concatenate((first_qubits, last_qubits))
+    single_qubits = np.column_stack((single_qubits, np.full(len(single_qubits), -1)))
+
+    qubits = np.concatenate((pair_qubits, single_qubits))
+    operators = np.full(qubits.shape, "Z")
+    operators[qubits < 0] = "I"
+    rows = np.concatenate((nodes[city_1], nodes[cities], nodes[cities]))
+    cols = np.concatenate((nodes[city_2], np.full(2 * reduced_number_of_nodes, starting_node)))
+    signs = np.concatenate((np.ones(len(pair_qubits)), -np.ones(2 * reduced_number_of_nodes)))
+    structure = PauliOperatorArrays(qubits, operators, np.ones(len(qubits)), np.zeros(len(qubits)), 1)
+    return structure, rows.astype(np.int64), cols.astype(np.int64), signs
+
+
+def create_phase_separator_arrays(distance_matrix, starting_node):
+    """
+    Creates the phase separator for given distances as PauliOperatorArrays
+    (one operator). The structure is cached, so only the coefficients are calculated.
+    """
+    distance_matrix = np.asarray(distance_matrix)
+    structure, rows, cols, signs = get_phase_separator_structure(len(distance_matrix), starting_node)
+    return structure.reweighted(signs * distance_matrix[rows, cols])
+
+
+@functools.lru_cache(maxsize=None)
+def get_mixer_arrays(reduced_number_of_nodes):
+    """
+    Creates the Hadfield mixers as PauliOperatorArrays, one operator for every
+    (t, u, v), in the same order as ForestTSPSolver.create_mixer.
+    For u != v the operator s+(u,t) s+(v,t+1) s-(u,t+1) s-(v,t) + h.c. with s+- = X +- iY
+    expands to the Pauli strings with an even number of Ys on these four qubits, with
+    coefficient 2 * (-1)^(number of Ys / 2) * (product of signs of the Ys);
+    for u == v it is 8 I + 8 Z(u,t) Z(u,t+1).
+    """
+    n = reduced_number_of_nodes
+    t, u, v = np.meshgrid(np.arange(n - 1), np.arange(n), np.arange(n), indexing='ij')
+    t, u, v = t.ravel(), u.ravel(), v.ravel()
+    groups = np.arange(len(t))
+    swap = u != v
+
+    # Qubits (u, t), (v, t+1), (u, t+1), (v, t) with signs +, +, -, - of iY in s+-.
+    swap_qubits = np.column_stack((t * n + u, (t + 1) * n + v, (t + 1) * n + u, t * n + v))[swap]
+    y_signs = np.array([1, 1, -1, -1])
+    patterns = np.array([pattern for pattern in np.ndindex(2, 2, 2, 2) if sum(pattern) % 2 == 0], dtype=bool)
+    pattern_operators = np.where(patterns, "Y", "X")
+    pattern_coefficients = np.array([2.0 * (-1)**(pattern.sum() // 2) * np.prod(y_signs[pattern]) for pattern in patterns])
+    swap_groups = np.repeat(groups[swap], len(patterns))
+    swap_qubits = np.repeat(swap_qubits, len(patterns), axis=0)
+    swap_operators = np.tile(pattern_operators, (swap.sum(), 1))
+    swap_coefficients = np.tile(pattern_coefficients, swap.sum())
+
+    same = ~swap
+    number_of_same = same.sum()
+    same_groups = np.repeat(groups[same], 2)
+    same_qubits = np.full((2 * number_of_same, 4), -1)
+    same_qubits[1::2, 0] = (t * n + u)[same]
+    same_qubits[1::2, 1] = ((t + 1) * n + u)[same]
+    same_operators = np.full((2 * number_of_same, 4), "I")
+    same_operators[1::2, :2] = "Z"
+    same_coefficients = np.full(2 * number_of_same, 8.0)
+
+    return PauliOperatorArrays(np.concatenate((swap_qubits, same_qubits)),
+                               np.concatenate((swap_operators, same_operators)),
+                               np.concatenate((swap_coefficients, same_coefficients)),
+                               np.concatenate((swap_groups, same_groups)),
+                               len(groups))
+
+
+@functools.lru_cache(maxsize=None)
+def get_mixer_matrices(reduced_number_of_nodes, subspace=False):
+    """
+    Returns sparse matrices of the mixers and their block eigensystems
+    (see qaoa_simulator.diagonalize_in_blocks), on the permutation subspace
+    or on all the basis states. Results are cached, as they do not depend on distances.
+    """
+    if subspace:
+        basis_states, _ = get_permutation_basis_states(reduced_number_of_nodes)
+    else:
+        basis_states = np.arange(2**(reduced_number_of_nodes**2))
+    matrices = get_mixer_arrays(reduced_number_of_nodes).to_sparse_matrices(basis_states)
+    eigensystems = [diagonalize_in_blocks(matrix) for matrix in matrices]
+    return matrices, eigensystems
@@ -0,0 +1,93 @@
+import numpy as np
+import scipy.sparse
+
+
+class TSPQubo(object):
+    """
+    QUBO for the Travelling Salesman Problem stored as NumPy arrays.
+    Qubit t * n + i is 1 when city i is visited at time t.
+    The linear part is kept in a vector of n^2 biases and the quadratic part
+    as COO arrays (rows, cols, values), built in a single vectorized pass.
+    Pairs are stored in the same (directed) way as in DWaveTSPSolver.qubo_dict,
+    so both representations describe the same energies.
+    Conversions to a dictionary, scipy CSR matrix and dimod.BinaryQuadraticModel
+    are computed only when requested and then cached.
+    """
+    def __init__(self, distance_matrix, cost_constant, constraint_constant):
+        self.distance_matrix = np.asarray(distance_matrix, dtype=float)
+        self.cost_constant = cost_constant
+        self.constraint_constant = constraint_constant
+        self.number_of_nodes = len(self.distance_matrix)
+        self.number_of_qubits = self.number_of_nodes**2
+        self.linear = None
+        self.rows = None
+        self.cols = None
+        self.values = None
+        self._dict = None
+        self._csr = None
+        self._bqm = None
+        self.build()
+
+    def build(self):
+        n = self.number_of_nodes
+        # Every qubit gets -constraint_constant from both time and position constraints.
+        self.linear = np.full(self.number_of_qubits, -2.0 * self.constraint_constant)
+
+        t, i, j = np.meshgrid(np.arange(n), np.arange(n), np.arange(n), indexing='ij')
+        t, i, j = t.ravel(), i.ravel(), j.ravel()
+        different = i != j
+        t, i, j = t[different], i[different], j[different]
+
+        # Cost objective: city i at time t followed by city j at time t + 1.
+        cost_rows = t * n + i
+        cost_cols = (t + 1) % n * n + j
+        cost_values = self.cost_constant * self.distance_matrix[i, j]
+
+        # Time constraints: two different cities at the same time t.
+        time_rows = t * n + i
+        time_cols = t * n + j
+
+        # Position constraints: the same city t at two different times i and j.
+        position_rows = i * n + t
+        position_cols = j * n + t
+
+        constraint_values = np.full(2 * len(t), 2.0 * self.constraint_constant)
+        self.rows = np.concatenate([cost_rows, time_rows, position_rows])
+        self.cols = np.concatenate([cost_cols, time_cols, position_cols])
+        self.values = np.concatenate([cost_values, constraint_values])
+
+    def to_dict(self):
+        """
+        Returns the QUBO as a dictionary {(qubit_a, qubit_b): bias},
+        as expected by dimod's sample_qubo.
+        """
+        if self._dict is None:
+            qubits = np.arange(self.number_of_qubits).tolist()
+            qubo_dict = dict(zip(zip(qubits, qubits), self.linear.tolist()))
+            qubo_dict.update(zip(zip(self.rows.tolist(), self.cols.tolist()), self.values.tolist()))
+            self._dict = qubo_dict
+        return self._dict
+
+    def to_csr(self):
+        """
+        Returns the QUBO as a scipy.sparse CSR matrix Q, so that the energy
+        of a binary vector x is x^T Q x.
+        """
+        if self._csr is None:
+            qubits = np.arange(self.number_of_qubits)
+            rows = np.concatenate([qubits, self.rows])
+            cols = np.concatenate([qubits, self.cols])
+            values = np.concatenate([self.linear, self.values])
+            shape = (self.number_of_qubits, self.number_of_qubits)
+            self._csr = scipy.sparse.coo_matrix((values, (rows, cols)), shape=shape).tocsr()
+        return self._csr
+
+    def to_bqm(self):
+        """
+        Returns the QUBO as a dimod.BinaryQuadraticModel.
+        """
+        if self._bqm is None:
+            import dimod
+            self._bqm = dimod.BinaryQuadraticModel.from_numpy_vectors(
+                self.linear, (self.rows, self.cols, self.values), 0.0, dimod.BINARY)
+        return self._bqm